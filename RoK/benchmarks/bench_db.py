@@ -0,0 +1,293 @@
+"""
+Benchmarks the database layer and the sync pipeline on synthetic data.
+
+Every GetUser, KvK and Id method and every sync mode is timed at each scale, against a
+temporary database and a local fake of the Sheets API, so it runs offline. Results are
+saved as JSON; given a baseline, the run fails if any median got slower than the
+threshold allows.
+
+usage, from the RoK directory:
+    python -m benchmarks.bench_db --output bench.json
+    python -m benchmarks.bench_db --baseline bench.json --threshold 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from benchmarks.datasets import FakeSheets, discord_id, generate, governor_id
+from extensions.database.cache import data_generation
+from extensions.database.pool import ConnectionPool
+from extensions.database.rok import (
+    GetUser,
+    GovernorSearch,
+    GSheet,
+    Id,
+    KvK,
+    link_cache,
+)
+from extensions.database.schema import migrate
+
+SCALES = [600, 10_000, 100_000]
+
+
+class OfflineGSheet(GSheet):
+    """GSheet that skips Google authentication, for the fake Sheets API."""
+
+    async def access_token(self) -> str:
+        return "benchmark"
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "calls": len(samples),
+        "median_us": statistics.median(samples) * 1e6,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6,
+        "mean_us": statistics.fmean(samples) * 1e6,
+    }
+
+
+async def measure(
+    call: Callable[[], Awaitable], repeat: int, uncached: bool = True
+) -> dict:
+    """Times ``repeat`` calls, clearing the link cache first so the database is hit."""
+    samples = []
+    for _ in range(repeat):
+        if uncached:
+            link_cache.clear()
+        began = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - began)
+    return summarize(samples)
+
+
+async def bench_scale(governors: int, repeat: int, sync_repeat: int) -> dict:
+    directory = tempfile.mkdtemp(prefix="rok-bench-")
+    pool = ConnectionPool(os.path.join(directory, "rok.sqlite3"))
+    pool.execute(migrate)
+
+    titles = {title: table for title, table in GSheet.worksheets.items()}
+    fake = FakeSheets(generate(governors), titles)
+    url = await fake.start()
+    gsheet = OfflineGSheet("benchmark", pool, base_url=url, drive_url=url)
+    results = {}
+
+    try:
+        # syncs, each full sync rebuilds from scratch
+        results["GSheet.sync_db_with_sheets[full]"] = await measure(
+            lambda: gsheet.sync_db_with_sheets("full"), sync_repeat, False
+        )
+        results["GSheet.sync_db_with_sheets[delta, unchanged]"] = await measure(
+            lambda: gsheet.sync_db_with_sheets("delta"), sync_repeat, False
+        )
+        changed = [generate(governors, changed_share=0.05), generate(governors)]
+        samples = []
+        for run in range(sync_repeat):
+            fake.set_worksheets(changed[run % 2], titles)
+            began = time.perf_counter()
+            await gsheet.sync_db_with_sheets("delta")
+            samples.append(time.perf_counter() - began)
+        results["GSheet.sync_db_with_sheets[delta, 5% changed]"] = summarize(samples)
+        results["GSheet.sync_if_changed[unchanged]"] = await measure(
+            lambda: gsheet.sync_if_changed("delta"), sync_repeat, False
+        )
+
+        rng = random.Random(1)
+        linked = pool.execute(
+            lambda cursor: [
+                (row[0], row[1])
+                for row in cursor.execute(
+                    'SELECT "Discord ID", "Governor ID" FROM accounts'
+                )
+            ]
+        )
+
+        newer_scan, older_scan = pool.execute(
+            lambda cursor: [
+                row[0]
+                for row in cursor.execute(
+                    "SELECT scan_id FROM scans WHERE source_table = 'kvk_top_600' "
+                    "ORDER BY scan_id DESC LIMIT 2"
+                )
+            ]
+        )
+
+        def any_governor() -> int:
+            return governor_id(rng.randrange(governors))
+
+        def any_link() -> tuple[int, int]:
+            return rng.choice(linked)
+
+        get_user, kvk, ids = GetUser(pool), KvK(pool), Id(pool)
+        calls = {
+            "GetUser.gov_user": lambda: get_user.gov_user(any_link()[0], "kvk", "main"),
+            "GetUser.gov_ids": lambda: get_user.gov_ids(any_link()[0]),
+            "GetUser.discord_username": lambda: get_user.discord_username(
+                any_governor(), "general"
+            ),
+            "GetUser.discord_id_from_gov_id": lambda: get_user.discord_id_from_gov_id(
+                any_link()[1]
+            ),
+            "GetUser.get_gov_id_from_discord": lambda: get_user.get_gov_id_from_discord(
+                any_link()[0]
+            ),
+            "KvK.user_stats[general]": lambda: kvk.user_stats(
+                any_governor(), "general"
+            ),
+            "KvK.user_stats[kvk]": lambda: kvk.user_stats(any_governor(), "kvk"),
+            "KvK.kvk_top_300_global_stats": lambda: kvk.kvk_top_300_global_stats(),
+            "KvK.kvk_top_x_player_stats[10]": lambda: kvk.kvk_top_x_player_stats(
+                "T4 Kills"
+            ),
+            "KvK.kvk_top_x_player_stats[100]": lambda: kvk.kvk_top_x_player_stats(
+                "T5 Kills", 100
+            ),
+            "KvK.user_ranks": lambda: kvk.user_ranks(any_governor()),
+            "KvK.gains": lambda: kvk.gains(any_governor(), older_scan, newer_scan),
+            "KvK.user_progress": lambda: kvk.user_progress(any_governor(), "kvk"),
+        }
+        for name, call in calls.items():
+            results[name] = await measure(call, repeat)
+
+        # a burst of identical reads, like everyone running /total at once
+        results["KvK.kvk_top_300_global_stats[burst of 50]"] = await measure(
+            lambda: asyncio.gather(
+                *(kvk.kvk_top_300_global_stats() for _ in range(50))
+            ),
+            repeat,
+        )
+
+        # cached lookups, after one warm-up call for a fixed user
+        warm_id = any_link()[0]
+        await get_user.gov_ids(warm_id)
+        results["GetUser.gov_ids[cached]"] = await measure(
+            lambda: get_user.gov_ids(warm_id), repeat, False
+        )
+
+        new_user = discord_id(governors + 1)
+        results["Id.save"] = await measure(
+            lambda: ids.save(new_user, "bench", any_governor(), "main"), repeat
+        )
+        results["Id.remove"] = await measure(
+            lambda: ids.remove(new_user, "main"), repeat
+        )
+
+        search = GovernorSearch(pool)
+        data_generation.bump()
+        began = time.perf_counter()
+        await search.refresh_index()
+        results["GovernorSearch.refresh_index"] = summarize(
+            [time.perf_counter() - began]
+        )
+        results["GovernorSearch.complete"] = await measure(
+            lambda: search.complete(rng.choice(["ab", "[a", "40001", "slay"])), repeat
+        )
+        results["GovernorSearch.find"] = await measure(
+            lambda: search.find(rng.choice(["abc", "ally", "ert"])), repeat
+        )
+    finally:
+        await gsheet.close()
+        await fake.stop()
+        pool.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns:
+        list: A line per benchmark whose median got slower than the threshold allows.
+    """
+    regressions = []
+    for scale, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous or not previous["median_us"]:
+                continue
+            ratio = result["median_us"] / previous["median_us"]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{scale} governors, {name}: {previous['median_us']:.0f} us -> "
+                    f"{result['median_us']:.0f} us ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    for scale, benchmarks in results.items():
+        print(f"\n{scale} governors")
+        width = max(map(len, benchmarks))
+        for name, result in benchmarks.items():
+            print(
+                f"  {name:<{width}}  median {result['median_us']:>12,.1f} us"
+                f"  p95 {result['p95_us']:>12,.1f} us  ({result['calls']} calls)"
+            )
+
+
+async def main(args: argparse.Namespace) -> int:
+    results = {}
+    for scale in args.scales:
+        # syncs at the largest scale take seconds, fewer runs keep the suite short
+        sync_repeat = max(2, min(args.sync_repeat, 60_000 // scale))
+        results[str(scale)] = await bench_scale(scale, args.repeat, sync_repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "sqlite": sqlite3.sqlite_version,
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+        print(f"\nSaved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        if regressions := compare(results, baseline, args.threshold):
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}:")
+            print("\n".join(f"  {line}" for line in regressions))
+            return 1
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scales",
+        type=lambda value: [int(scale) for scale in value.split(",")],
+        default=SCALES,
+        help="comma separated numbers of governors (default: 600,10000,100000)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=200, help="calls per method (default: 200)"
+    )
+    parser.add_argument(
+        "--sync-repeat", type=int, default=5, help="runs per sync mode (default: 5)"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed slowdown of a median before it counts as a regression",
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,165 @@
+import json
+import random
+from typing import Optional
+
+from aiohttp import web
+
+###
+### Synthetic data
+###
+# Worksheets shaped like the real spreadsheet: formatted numbers with thousands
+# separators, a header row, governors with linked Discord accounts. Everything is seeded,
+# the same scale always produces the same data.
+
+FIRST_GOVERNOR_ID = 40_000_000
+FIRST_DISCORD_ID = 300_000_000_000_000_000
+LINKED_SHARE = 0.3  # share of governors linked to a Discord account
+
+
+def governor_id(index: int) -> int:
+    return FIRST_GOVERNOR_ID + index
+
+
+def discord_id(index: int) -> int:
+    return FIRST_DISCORD_ID + index
+
+
+def governor_name(rng: random.Random, index: int) -> str:
+    tag = "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=3))
+    name = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 12)))
+    return f"[{tag}] {name.capitalize()}{index}"
+
+
+def formatted(number: int) -> str:
+    return format(number, ",")
+
+
+def generate(
+    governors: int, seed: int = 0, changed_share: float = 0.0
+) -> dict[str, list[list]]:
+    """
+    Generates the worksheets of the spreadsheet for ``governors`` governors.
+
+    Args:
+        governors (int): Number of governors in the stats worksheets.
+        seed (int): Seed of the data.
+        changed_share (float): Share of governors whose stats differ from the same seed
+            at 0, to simulate a new scan.
+
+    Returns:
+        dict: Rows of every worksheet keyed by table, header row first.
+    """
+    rng = random.Random(seed)
+    changes = random.Random(seed + 1)
+
+    basic = [
+        [
+            "Governor ID",
+            "Governor Name",
+            "Power",
+            "Kill Points",
+            "Deaths",
+            "T4 Kills",
+            "T5 Kills",
+            "Alliance",
+        ]
+    ]
+    kvk = [
+        [
+            "Governor ID",
+            "Governor Name",
+            "Power",
+            "Rank",
+            "DKP Required",
+            "DKP Achieved",
+            "Deaths",
+            "T4 Kills",
+            "T5 Kills",
+            "Alliance",
+        ]
+    ]
+    accounts = [["Discord ID", "Discord Username", "Governor ID", "ALT ID", "FARM ID"]]
+
+    for index in range(governors):
+        name = governor_name(rng, index)
+        alliance = f"ALLY{rng.randint(1, 40)}"
+        power = rng.randint(5_000_000, 200_000_000)
+        t4, t5 = rng.randint(0, 20_000_000), rng.randint(0, 10_000_000)
+        deaths = rng.randint(0, 5_000_000)
+        if changes.random() < changed_share:
+            t4 += changes.randint(1, 100_000)
+            t5 += changes.randint(1, 50_000)
+        dkp = t4 * 10 + t5 * 30 + deaths * 60
+
+        gov_id = governor_id(index)
+        basic.append(
+            [gov_id, name, *map(formatted, (power, t4 * 10 + t5 * 20, deaths, t4, t5))]
+            + [alliance]
+        )
+        kvk.append(
+            [gov_id, name, formatted(power), index + 1, formatted(power // 10)]
+            + [*map(formatted, (dkp, deaths, t4, t5)), alliance]
+        )
+        if rng.random() < LINKED_SHARE:
+            alt = governor_id(rng.randrange(governors)) if rng.random() < 0.3 else ""
+            accounts.append([discord_id(index), f"user{index}", gov_id, alt, ""])
+
+    return {"accounts": accounts, "basic_top_600": basic, "kvk_top_600": kvk}
+
+
+class FakeSheets:
+    """
+    A local stand-in for the Sheets and Drive APIs, serving one spreadsheet.
+
+    ``GSheet`` and ``SheetsReader`` talk to it through their base URLs.
+    """
+
+    def __init__(self, worksheets: dict[str, list[list]], titles: dict[str, str]):
+        """
+        Args:
+            worksheets (dict): Rows keyed by table, as returned by ``generate``.
+            titles (dict): Worksheet title of each table.
+        """
+        self.version = 1
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+        self.set_worksheets(worksheets, titles)
+
+    def set_worksheets(
+        self, worksheets: dict[str, list[list]], titles: dict[str, str]
+    ) -> None:
+        # encoded once, so serving it doesn't count towards the timed sync
+        self.body = json.dumps(
+            {
+                "valueRanges": [
+                    {"range": title, "values": worksheets[table]}
+                    for title, table in titles.items()
+                ]
+            }
+        ).encode()
+        self.version += 1
+
+    async def batch_get(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.body, content_type="application/json")
+
+    async def drive_file(self, request: web.Request) -> web.Response:
+        return web.json_response({"version": str(self.version)})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get(
+            "/v4/spreadsheets/{sheet_id}/values:batchGet", self.batch_get
+        )
+        app.router.add_get("/drive/v3/files/{sheet_id}", self.drive_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,499 @@
+"""
+Load-tests the interaction handlers against a synthetic database.
+
+The real slash command callbacks and menu/view button callbacks run on fake contexts,
+with Discord's REST API replaced by a stub that sleeps for a configurable latency.
+Scenarios (a command and the button presses that follow it) start at a target rate,
+each interaction is timed from its arrival to its first response, which Discord
+requires within 3 seconds.
+
+usage, from the RoK directory:
+    python -m benchmarks.load_test --rate 20 --duration 30
+    python -m benchmarks.load_test --mix stats=1,top10=1 --rest-latency 0.2
+    python -m benchmarks.load_test --replay recorded.jsonl
+
+A replay file has one JSON object per line: {"at": seconds, "scenario": name}.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Optional
+
+import hikari
+import lightbulb
+import miru
+from benchmarks.datasets import generate
+from extensions.database.ingest import bulk_load, normalize_records
+from extensions.database.rok import default_pool
+from extensions.database.schema import migrate
+from extensions.database.sheets import iter_records
+from extensions.rok import responses
+
+DEADLINE = 3.0  # seconds Discord waits for the first response to an interaction
+
+DEFERRED = (
+    hikari.ResponseType.DEFERRED_MESSAGE_CREATE,
+    hikari.ResponseType.DEFERRED_MESSAGE_UPDATE,
+)
+
+DEFAULT_MIX = {
+    "stats": 35,
+    "stats_other": 10,
+    "stats_menu": 20,
+    "top10": 20,
+    "total": 5,
+    "progress": 10,
+}
+
+
+###
+### Fakes
+###
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = hikari.Snowflake(user_id)
+        self.username = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.avatar_url = None
+
+
+class StubRest:
+    """The parts of hikari's REST client the handlers use, answering after a delay."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        await self.call()
+        return FakeUser(user_id)
+
+
+class FakeMessage:
+    def __init__(self, rest: StubRest):
+        self.id = hikari.Snowflake(next(_message_ids))
+        self.rest = rest
+
+    async def edit(self, *args, **kwargs) -> "FakeMessage":
+        await self.rest.call()
+        return self
+
+
+_message_ids = itertools.count(1)
+
+
+class FakeResponse:
+    def __init__(self, message: FakeMessage):
+        self.message = message
+
+    def __await__(self):
+        yield from asyncio.sleep(0).__await__()
+        return self.message
+
+
+class Interaction:
+    """One timed interaction; fake contexts and interactions report responses here."""
+
+    def __init__(self, kind: str, rest: StubRest):
+        self.kind = kind
+        self.rest = rest
+        self.arrived_at = time.perf_counter()
+        self.responded_at: Optional[float] = None
+        self.deferred = False
+
+    async def respond(self, *args, **kwargs) -> FakeResponse:
+        if self.responded_at is None:
+            self.deferred = bool(args) and args[0] in DEFERRED
+            self.responded_at = time.perf_counter()
+        await self.rest.call()
+        return FakeResponse(FakeMessage(self.rest))
+
+    # hikari.ComponentInteraction / CommandInteraction methods used by miru builders
+    async def create_initial_response(self, *args, **kwargs) -> None:
+        await self.respond(*args, **kwargs)
+
+    async def edit_initial_response(self, *args, **kwargs) -> FakeMessage:
+        return (await self.respond()).message
+
+
+class FakeApp:
+    def __init__(self, bot: lightbulb.BotApp, rest: StubRest):
+        self.rest = rest
+        self.d = bot.d
+
+
+class FakeSlashContext:
+    """Stands in for lightbulb.SlashContext."""
+
+    def __init__(
+        self, app: FakeApp, user: FakeUser, interaction: Interaction, **options
+    ):
+        self.app = app
+        self.bot = app
+        self.author = self.user = user
+        self.member = None
+        self.interaction = interaction
+        self.options = SimpleNamespace(
+            **{"id": None, "category": None, "account": None, **options}
+        )
+
+    async def respond(self, *args, **kwargs) -> FakeResponse:
+        return await self.interaction.respond(*args, **kwargs)
+
+
+class FakeViewContext:
+    """Stands in for miru.ViewContext in button callbacks."""
+
+    def __init__(
+        self,
+        app: FakeApp,
+        user: FakeUser,
+        interaction: Interaction,
+        message: FakeMessage,
+    ):
+        self.app = app
+        self.client = app
+        self.user = self.author = user
+        self.member = None
+        self.interaction = interaction
+        self.message = message
+        self.is_valid = True
+
+    @property
+    def issued_response(self) -> bool:
+        return self.interaction.responded_at is not None
+
+    async def defer(self, *args, **kwargs) -> None:
+        await self.interaction.respond(*args, **kwargs)
+
+    async def respond(self, *args, **kwargs) -> FakeResponse:
+        return await self.interaction.respond()
+
+    async def edit_response(self, *args, **kwargs) -> FakeMessage:
+        return (await self.interaction.respond()).message
+
+
+# handlers tell the kinds of contexts apart with isinstance
+lightbulb.SlashContext.register(FakeSlashContext)
+miru.ViewContext.register(FakeViewContext)
+
+
+# views started by the scenario running in the current task
+_started_views: contextvars.ContextVar[list] = contextvars.ContextVar("started_views")
+
+
+class RecordingClient(miru.Client):
+    """A miru client that hands the views a command starts to the scenario."""
+
+    def start_view(self, view: miru.View, *, bind_to=hikari.UNDEFINED) -> None:
+        _started_views.get().append(view)
+
+
+###
+### Scenarios
+###
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rest = StubRest(args.rest_latency)
+        self.results: list[tuple[str, float, float, Optional[str], bool]] = []
+        self.rng = random.Random(args.seed)
+
+        from extensions.rok import slash_commands
+
+        self.commands = slash_commands
+        self.bot = lightbulb.BotApp(
+            token="load-test", intents=hikari.Intents.NONE, banner=None
+        )
+        self.bot.d.miru = RecordingClient(self.bot)
+        self.bot.add_plugin(slash_commands.plugin)
+        self.app = FakeApp(self.bot, self.rest)
+        self.linked: list[tuple[int, int]] = []
+
+    def load_data(self) -> None:
+        # two scans, so /progress has something to compare
+        for changed_share in (0.0, 0.5):
+            worksheets = generate(self.args.governors, changed_share=changed_share)
+            tables = {
+                table: normalize_records(table, iter_records(values), [])
+                for table, values in worksheets.items()
+            }
+            default_pool.execute(bulk_load, tables)
+        self.linked = default_pool.execute(
+            lambda cursor: [
+                (row[0], row[1])
+                for row in cursor.execute(
+                    'SELECT "Discord ID", "Governor ID" FROM accounts'
+                )
+            ]
+        )
+
+    async def interaction(
+        self, kind: str, handler: Callable[[Interaction], Awaitable]
+    ) -> None:
+        interaction = Interaction(kind, self.rest)
+        error = None
+        try:
+            await handler(interaction)
+        except Exception as exception:
+            error = f"{type(exception).__name__}: {exception}"
+        finished_at = time.perf_counter()
+        responded_at = interaction.responded_at or finished_at
+        self.results.append(
+            (
+                kind,
+                responded_at - interaction.arrived_at,
+                finished_at - interaction.arrived_at,
+                error,
+                interaction.deferred,
+            )
+        )
+
+    async def think(self) -> None:
+        await asyncio.sleep(self.rng.uniform(0.2, 1.0) * self.args.think)
+
+    async def press(self, view: miru.View, user: FakeUser, kind: str, label: str):
+        async def handler(interaction: Interaction) -> None:
+            message = view.message or FakeMessage(self.rest)
+            context = FakeViewContext(self.app, user, interaction, message)
+            # what miru sets before a callback: the context to edit through
+            view._last_context = context
+            item = next(item for item in view.children if item.label == label)
+
+            errors = []
+
+            async def on_error(error: Exception, item=None, context=None) -> None:
+                errors.append(error)
+
+            view.on_error = on_error
+            # through the view, like miru does, so TimedView's budget applies
+            await view._handle_callback(item, context)
+            if errors:
+                raise errors[0]
+
+        await self.interaction(kind, handler)
+
+    async def slash(self, kind: str, command, user: FakeUser, **options) -> list:
+        views = []
+        _started_views.set(views)
+
+        async def handler(interaction: Interaction) -> None:
+            await command.callback(
+                FakeSlashContext(self.app, user, interaction, **options)
+            )
+
+        await self.interaction(kind, handler)
+        return views
+
+    def any_user(self) -> tuple[FakeUser, int]:
+        discord_id, gov_id = self.rng.choice(self.linked)
+        return FakeUser(discord_id), gov_id
+
+    async def scenario(self, name: str) -> None:
+        commands = self.commands
+        user, gov_id = self.any_user()
+        category = self.rng.choice(["general", "kvk"])
+
+        if name == "stats":
+            await self.slash(
+                "/stats", commands.stats, user, category=category, account="main"
+            )
+        elif name == "stats_other":
+            _, other_gov_id = self.any_user()
+            await self.slash(
+                "/stats id",
+                commands.stats,
+                user,
+                category=category,
+                account="main",
+                id=str(other_gov_id),
+            )
+        elif name == "stats_menu":
+            views = await self.slash("/stats menu", commands.stats, user)
+            if views:
+                await self.think()
+                label = "General" if category == "general" else "KvK"
+                await self.press(views[0], user, "button: stats category", label)
+                await self.think()
+                await self.press(
+                    views[0], user, "button: stats account", "Main Account"
+                )
+        elif name == "top10":
+            stat = self.rng.choice(["T4 Kills", "T5 Kills", "Deaths"])
+            views = await self.slash(
+                "/top10", commands.top10, user, category=stat, count=10
+            )
+            if views:
+                await self.think()
+                await self.press(views[0], user, "button: toggle names", "Toggle names")
+        elif name == "total":
+            await self.slash("/total", commands.total, user)
+        elif name == "progress":
+            await self.slash(
+                "/progress", commands.progress, user, id=gov_id, days=7, category="kvk"
+            )
+        else:
+            raise ValueError(f"Unknown scenario: {name}")
+
+    def schedule(self) -> list[tuple[float, str]]:
+        """Returns (start time, scenario) pairs, from a replay file or the mix."""
+        if self.args.replay:
+            with open(self.args.replay) as file:
+                events = [json.loads(line) for line in file if line.strip()]
+            return sorted((event["at"], event["scenario"]) for event in events)
+
+        names, weights = zip(*self.args.mix.items())
+        schedule, at = [], 0.0
+        while True:
+            # Poisson arrivals around the target rate
+            at += self.rng.expovariate(self.args.rate)
+            if at >= self.args.duration:
+                return schedule
+            schedule.append((at, self.rng.choices(names, weights)[0]))
+
+    async def run(self) -> float:
+        schedule = self.schedule()
+        began = time.perf_counter()
+        tasks = []
+        for at, name in schedule:
+            if (delay := began + at - time.perf_counter()) > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.scenario(name)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - began
+
+
+###
+### Report
+###
+
+
+def percentile(samples: list[float], share: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+def report(results: list, elapsed: float, rest: StubRest) -> dict:
+    by_kind: dict[str, list] = {}
+    for result in results:
+        by_kind.setdefault(result[0], []).append(result)
+    by_kind["all"] = results
+
+    summary = {}
+    for kind, rows in by_kind.items():
+        responses = [row[1] for row in rows]
+        summary[kind] = {
+            "count": len(rows),
+            "throughput_per_s": len(rows) / elapsed,
+            "p50_ms": percentile(responses, 0.50) * 1000,
+            "p95_ms": percentile(responses, 0.95) * 1000,
+            "p99_ms": percentile(responses, 0.99) * 1000,
+            "max_ms": max(responses) * 1000,
+            "mean_total_ms": statistics.fmean(row[2] for row in rows) * 1000,
+            "deadline_misses": sum(response > DEADLINE for response in responses),
+            "deferred": sum(row[4] for row in rows),
+            "errors": sum(row[3] is not None for row in rows),
+        }
+
+    width = max(map(len, summary))
+    print(
+        f"{'interaction':<{width}}  {'count':>6}  {'per s':>7}  {'p50 ms':>8}"
+        f"  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  {'missed':>6}  {'deferred':>8}  {'errors':>6}"
+    )
+    for kind, row in summary.items():
+        print(
+            f"{kind:<{width}}  {row['count']:>6}  {row['throughput_per_s']:>7.1f}"
+            f"  {row['p50_ms']:>8.1f}  {row['p95_ms']:>8.1f}  {row['p99_ms']:>8.1f}"
+            f"  {row['max_ms']:>8.1f}  {row['deadline_misses']:>6}  {row['deferred']:>8}  {row['errors']:>6}"
+        )
+    print(f"\n{elapsed:.1f}s, {rest.calls} stubbed REST calls")
+
+    errors = {row[3] for row in results if row[3]}
+    for error in itertools.islice(errors, 5):
+        print(f"error: {error}")
+    return summary
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def main(args: argparse.Namespace) -> int:
+    directory = tempfile.mkdtemp(prefix="rok-load-")
+    # every repository in the extensions uses the default pool, point it at a scratch db
+    default_pool.db_path = os.path.join(directory, "rok.sqlite3")
+    if args.budget is not None:
+        responses.response_budget = args.budget
+    default_pool.execute(migrate)
+
+    load_test = LoadTest(args)
+    load_test.load_data()
+    elapsed = await load_test.run()
+    summary = report(load_test.results, elapsed, load_test.rest)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=2)
+    default_pool.close()
+    return 1 if summary["all"]["deadline_misses"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rate", type=float, default=10, help="scenarios started per second"
+    )
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="scenario weights, e.g. stats=35,top10=20 "
+        f"(scenarios: {', '.join(DEFAULT_MIX)})",
+    )
+    parser.add_argument("--replay", help="JSONL file of scenarios to replay instead")
+    parser.add_argument(
+        "--rest-latency",
+        type=float,
+        default=0.1,
+        help="seconds every stubbed REST call takes (default: 0.1)",
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=1.0,
+        help="scale of the pause between button presses (default: 1.0)",
+    )
+    parser.add_argument(
+        "--governors", type=int, default=600, help="size of the synthetic data"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        help="seconds before a response is deferred (default: from config.json)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the summary to this JSON file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
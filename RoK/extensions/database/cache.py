@@ -0,0 +1,213 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Hashable, Optional
+
+from metrics import coalesced_calls
+
+
+class Generation:
+    """
+    Counts how many times the bot's data has been replaced.
+
+    Every sync bumps it, and anything cached against an older generation is stale.
+    ``synced_at`` is when the data was last confirmed to match its source.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self.synced_at: Optional[datetime] = None
+
+    def bump(self) -> int:
+        self.value += 1
+        return self.value
+
+
+data_generation = Generation()
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    A bounded LRU cache whose entries expire after ``ttl`` seconds or when the data
+    generation moves on.
+
+    Only meant to be used from the event loop thread, it does no locking.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300,
+        generation: Optional[Generation] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = generation or data_generation
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # key: (expires at, generation, value)
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, generation, value = entry
+            if expires_at > time.monotonic() and generation == self.generation.value:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return default
+
+    def snapshot(self) -> tuple[int, int]:
+        """
+        Returns:
+            tuple: The data generation and invalidation count, pass it to ``set`` to
+                store a value read after taking it.
+
+            :format: (generation, invalidations)
+        """
+        return self.generation.value, self.invalidations
+
+    def set(
+        self, key: Hashable, value: Any, snapshot: Optional[tuple[int, int]] = None
+    ) -> None:
+        """
+        Stores ``value``. With a ``snapshot``, nothing is stored if a sync or an
+        invalidation landed since it was taken, as the value may predate them.
+        """
+        if snapshot is not None and snapshot != self.snapshot():
+            return
+        self._entries[key] = (
+            time.monotonic() + self.ttl,
+            self.generation.value,
+            value,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Drops every entry whose key matches the predicate.
+
+        Returns:
+            int: Number of dropped entries.
+        """
+        self.invalidations += 1
+        stale = [key for key in self._entries if predicate(key)]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Usage counters of the cache.
+
+            :format: {"hits": int, "misses": int, "hit_rate": float, "size": int}
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+    def cached(self, namespace: str) -> Callable:
+        """
+        Caches an async method's results under ``(namespace, id, *args)``.
+
+        The first argument must be an ID, it's passed through int() so that str, int and
+        Snowflake IDs share an entry. None results are cached too, so repeated lookups of
+        unlinked users stay cheap.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(instance, id_, *args):
+                key = (namespace, int(id_), *args)
+                value = self.get(key, _MISSING)
+                if value is _MISSING:
+                    snapshot = self.snapshot()
+                    value = await func(instance, id_, *args)
+                    self.set(key, value, snapshot)
+                return value
+
+            return wrapper
+
+        return decorator
+
+
+class SingleFlight:
+    """
+    Runs concurrent identical calls of async repository methods once, every caller
+    awaits the same execution and gets the same result.
+
+    Nothing is kept once the call returns, unlike TTLCache. Calls only join one that
+    started in the same data generation and, when ``cache`` is given, before the last
+    invalidation of it, so a caller never gets data read before a write it waited for.
+    """
+
+    def __init__(
+        self, generation: Optional[Generation] = None, cache: Optional[TTLCache] = None
+    ):
+        self.generation = generation or data_generation
+        self.cache = cache
+        self.saved = 0
+        # key: the running call
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def coalesce(self, func: Callable) -> Callable:
+        """
+        Decorates an async method of a Repository. Calls with the same arguments on the
+        same pool are one call while it runs. Saved calls are counted in
+        ``rok_coalesced_calls_total``.
+        """
+        call = func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(instance, *args, **kwargs):
+            key = (
+                call,
+                instance.pool,
+                self.generation.value,
+                None if self.cache is None else self.cache.invalidations,
+                args,
+                tuple(sorted(kwargs.items())),
+            )
+            task = self._in_flight.get(key)
+            if task is not None:
+                self.saved += 1
+                coalesced_calls.inc(call=call)
+            else:
+                task = asyncio.ensure_future(func(instance, *args, **kwargs))
+                self._in_flight[key] = task
+                task.add_done_callback(functools.partial(self._done, key))
+            # a cancelled caller must not cancel the call for everyone else
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every caller was cancelled
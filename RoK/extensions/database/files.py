@@ -0,0 +1,117 @@
+import csv
+import os
+from typing import Iterator, Optional
+
+from extensions.database.ingest import (
+    RejectedCell,
+    check_headers,
+    normalize_header,
+    normalize_record,
+)
+from extensions.database.schema import TABLES
+
+###
+### Offline imports
+###
+# Scanner tools export CSV or XLSX files that can hold tens of thousands of rows. Files
+# are read row by row and handed to the loaders as generators, the same way worksheets
+# are, so memory stays flat no matter the size of the file.
+
+FILE_TYPES = (".csv", ".xlsx")
+
+
+def csv_rows(path: str) -> Iterator[list]:
+    # utf-8-sig drops the byte order mark Excel puts in front of CSV exports
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        sample = file.read(64 * 1024)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(file, dialect)
+
+
+def xlsx_rows(path: str) -> Iterator[list]:
+    try:
+        import openpyxl
+    except ImportError as error:
+        raise RuntimeError("Reading .xlsx files requires openpyxl") from error
+
+    # read only mode streams the sheet instead of loading the whole workbook
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if cell is None else cell for cell in row]
+    finally:
+        workbook.close()
+
+
+def file_rows(path: str) -> Iterator[list]:
+    """
+    Lazily reads the rows of a CSV or XLSX file, header row first.
+
+    Raises:
+        ValueError: The file is neither CSV nor XLSX.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return csv_rows(path)
+    if extension == ".xlsx":
+        return xlsx_rows(path)
+    raise ValueError(
+        f"Unsupported file type {extension!r}, expected one of {FILE_TYPES}"
+    )
+
+
+def detect_table(headers: list) -> str:
+    """
+    Picks the table a file is meant for from its headers.
+
+    Returns:
+        str: The table with the most columns whose every column has a header.
+
+    Raises:
+        ValueError: No table matches the headers.
+    """
+    headers = {normalize_header(header) for header in headers}
+    matches = [
+        table
+        for table, columns in TABLES.items()
+        if {normalize_header(column) for column in columns} <= headers
+    ]
+    if not matches:
+        raise ValueError(f"The headers don't match any table: {sorted(headers)}")
+    return max(matches, key=lambda table: len(TABLES[table]))
+
+
+def file_records(
+    path: str, table: Optional[str], rejected: list[RejectedCell]
+) -> tuple[str, Iterator[dict]]:
+    """
+    Opens a scan export and converts its rows into rows of a table.
+
+    Only the header row is read up front, the rest is parsed as the loader consumes it.
+
+    Args:
+        path (str): Path of the CSV or XLSX file.
+        table (str): Table the file is meant for, detected from the headers if None.
+        rejected (list): Collects the cells that could not be parsed.
+
+    Returns:
+        tuple: The table and its records keyed by the table's column names.
+    """
+    rows = file_rows(path)
+    headers = [str(header) for header in next(rows, [])]
+    table = table or detect_table(headers)
+    check_headers(os.path.basename(path), table, headers)
+
+    def records() -> Iterator[dict]:
+        for number, row in enumerate(rows, 2):
+            # exports often end with empty rows, they aren't worth reporting as skipped
+            if all(cell == "" for cell in row):
+                continue
+            record = dict(zip(headers, list(row) + [""] * (len(headers) - len(row))))
+            yield normalize_record(table, record, number, rejected)
+
+    return table, records()
@@ -0,0 +1,153 @@
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+###
+### Scan history
+###
+# basic_top_600 and kvk_top_600 only hold the latest data, so every load that changes
+# one of them also stores a copy of its stats as a new, never modified scan. Only
+# integer stats are kept, one row per governor per scan, keyed by (governor, scan) so
+# everything about one governor sits together in the table and a gains query reads a
+# handful of rows, not the whole history.
+
+# stats kept in snapshots, a table stores the ones it has and leaves the rest NULL
+SNAPSHOT_STATS = [
+    "Power",
+    "Kill Points",
+    "DKP Achieved",
+    "Deaths",
+    "T4 Kills",
+    "T5 Kills",
+]
+SNAPSHOT_TABLES = {
+    "basic_top_600": ["Power", "Kill Points", "Deaths", "T4 Kills", "T5 Kills"],
+    "kvk_top_600": ["Power", "DKP Achieved", "Deaths", "T4 Kills", "T5 Kills"],
+}
+
+_stat_columns = ", ".join(f'"{stat}" INTEGER' for stat in SNAPSHOT_STATS)
+
+TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS scans (
+        scan_id INTEGER PRIMARY KEY,
+        source_table TEXT NOT NULL,
+        taken_at TEXT NOT NULL,
+        source TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_scans_source_table ON scans (source_table, taken_at)",
+    f"""
+    CREATE TABLE IF NOT EXISTS scan_stats (
+        governor_id INTEGER NOT NULL,
+        scan_id INTEGER NOT NULL REFERENCES scans (scan_id),
+        {_stat_columns},
+        PRIMARY KEY (governor_id, scan_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_scan_stats_scan_id ON scan_stats (scan_id)",
+]
+
+
+def record(
+    cursor: sqlite3.Cursor, tables: Iterable[str], source: Optional[str] = None
+) -> dict[str, int]:
+    """
+    Stores the current contents of the given tables as new scans.
+
+    Runs inside the caller's transaction, right after the tables were loaded. Tables
+    without history are ignored.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the database.
+        tables (Iterable): Tables that were loaded.
+        source (str): Where the data came from, e.g. a file name.
+
+    Returns:
+        dict: The ID of the new scan of each table.
+    """
+    taken_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    scans = {}
+    for table in sorted(SNAPSHOT_TABLES.keys() & set(tables)):
+        cursor.execute(
+            "INSERT INTO scans (source_table, taken_at, source) VALUES (?, ?, ?)",
+            (table, taken_at, source),
+        )
+        scan_id = cursor.lastrowid
+        columns = ", ".join(f'"{stat}"' for stat in SNAPSHOT_TABLES[table])
+        cursor.execute(
+            f"""
+            INSERT INTO scan_stats (governor_id, scan_id, {columns})
+            SELECT "Governor ID", ?, {columns} FROM {table}
+            """,
+            (scan_id,),
+        )
+        scans[table] = scan_id
+    return scans
+
+
+def governor_scan(
+    cursor: sqlite3.Cursor,
+    gov_id: int,
+    table: str,
+    taken_before: Optional[str] = None,
+    earliest: bool = False,
+) -> Optional[sqlite3.Row]:
+    """
+    Finds a scan of ``table`` that includes the governor.
+
+    Args:
+        gov_id (int): Governor ID.
+        table (str): Table the scan was taken of.
+        taken_before (str): ISO 8601 time the scan can't be newer than.
+        earliest (bool): Return the oldest matching scan instead of the newest.
+
+    Returns:
+        sqlite3.Row: The scan's scan_id and taken_at, or None.
+    """
+    cursor.execute(
+        f"""
+        SELECT scans.scan_id, scans.taken_at
+        FROM scan_stats JOIN scans USING (scan_id)
+        WHERE scan_stats.governor_id = ? AND scans.source_table = ?
+            AND (? IS NULL OR scans.taken_at <= ?)
+        ORDER BY scan_stats.scan_id {'ASC' if earliest else 'DESC'}
+        LIMIT 1
+        """,
+        (gov_id, table, taken_before, taken_before),
+    )
+    return cursor.fetchone()
+
+
+def gains(
+    cursor: sqlite3.Cursor, gov_id: int, from_scan: int, to_scan: int
+) -> Optional[dict[str, dict[str, Optional[int]]]]:
+    """
+    Compares a governor's stats between two scans.
+
+    Returns:
+        dict: The stats of both scans and the difference, None if the governor is
+            missing from either scan. Stats the scans don't have are left out.
+
+        :format: {stat: {"before": int, "after": int, "gain": int}}
+    """
+    columns = ", ".join(f'"{stat}"' for stat in SNAPSHOT_STATS)
+    cursor.execute(
+        f"SELECT scan_id, {columns} FROM scan_stats "
+        "WHERE governor_id = ? AND scan_id IN (?, ?)",
+        (gov_id, from_scan, to_scan),
+    )
+    rows = {row["scan_id"]: row for row in cursor.fetchall()}
+    if from_scan not in rows or to_scan not in rows:
+        return None
+
+    before, after = rows[from_scan], rows[to_scan]
+    return {
+        stat: {
+            "before": before[stat],
+            "after": after[stat],
+            "gain": after[stat] - before[stat],
+        }
+        for stat in SNAPSHOT_STATS
+        if before[stat] is not None and after[stat] is not None
+    }
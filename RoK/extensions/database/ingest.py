@@ -0,0 +1,467 @@
+import functools
+import hashlib
+import sqlite3
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+
+from extensions.database import history, leaderboard, search
+from extensions.database.schema import (
+    BOT_EDITED_TABLES,
+    ROW_HASH,
+    TABLES,
+    create_indexes_sql,
+    create_table_sql,
+    integer_columns,
+    primary_key,
+)
+
+
+class RejectedCell(NamedTuple):
+    table: str
+    row: int  # row number as shown in the source, the header being row 1
+    column: str
+    value: Any
+
+
+@dataclass
+class SyncReport:
+    """
+    Outcome of loading data into the database.
+
+    rows: number of rows in each table after the load
+    skipped: rows per table dropped for a missing or duplicate key
+    rejected: cells that could not be parsed and were stored as NULL
+    changes: per table counts of added, changed, removed and unchanged rows, delta
+        syncs only
+    changed_tables: tables whose contents changed
+    source: where the data came from, stored with the scans the load creates
+    """
+
+    rows: dict[str, int] = field(default_factory=dict)
+    skipped: dict[str, int] = field(default_factory=dict)
+    rejected: list[RejectedCell] = field(default_factory=list)
+    changes: dict[str, dict[str, int]] = field(default_factory=dict)
+    changed_tables: set[str] = field(default_factory=set)
+    source: Optional[str] = None
+
+    def summary(self, max_rejected: int = 5) -> str:
+        lines = []
+        for table, count in self.rows.items():
+            line = f"{table}: {count} rows"
+            if changes := self.changes.get(table):
+                line += (
+                    f" ({changes['added']} added, {changes['changed']} changed,"
+                    f" {changes['removed']} removed, {changes['unchanged']} unchanged)"
+                )
+            if skipped := self.skipped.get(table):
+                line += f" ({skipped} skipped)"
+            lines.append(line)
+        if self.rejected:
+            lines.append(f"{len(self.rejected)} cells rejected:")
+            lines.extend(
+                f"- {cell.table} row {cell.row}, {cell.column}: {cell.value!r}"
+                for cell in self.rejected[:max_rejected]
+            )
+            if len(self.rejected) > max_rejected:
+                lines.append(f"- ...and {len(self.rejected) - max_rejected} more")
+        return "\n".join(lines)
+
+
+def parse_int(value: Any) -> Optional[int]:
+    """
+    Parses a spreadsheet number such as ``1,234,567`` into an integer.
+
+    Args:
+        value: Raw cell value.
+
+    Returns:
+        int: The parsed number, or None for an empty cell.
+
+    Raises:
+        ValueError: The cell isn't a whole number.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        raise ValueError(value)
+
+    text = str(value).strip()
+    if not text:
+        return None
+    # thousands separators: commas, regular and non-breaking spaces
+    text = text.replace(",", "").replace(" ", "").replace("\u00a0", "")
+    try:
+        return int(text)
+    except ValueError:
+        number = float(text)  # "1.2e6" or "1234.0", still raises on text
+        if not number.is_integer():
+            raise
+        return int(number)
+
+
+def normalize_header(header: str) -> str:
+    """Normalize a header by stripping spaces and converting to lowercase."""
+    return str(header).strip().lower()
+
+
+def check_headers(source: str, table: str, headers: Iterable[str]) -> None:
+    """
+    Makes sure a source has a header for every column of ``table``.
+
+    Raises:
+        ValueError: Some columns are missing, ``source`` names the source in the message.
+    """
+    missing = {normalize_header(column) for column in TABLES[table]} - {
+        normalize_header(header) for header in headers
+    }
+    if missing:
+        raise ValueError(f"Missing headers in {source}: {missing}")
+
+
+# every record of a source repeats the same headers, so the lookups are cached
+@functools.lru_cache(maxsize=None)
+def _column_for(table: str, header: str) -> Optional[str]:
+    header = normalize_header(header)
+    for column in TABLES[table]:
+        if normalize_header(column) == header:
+            return column
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _integer_columns(table: str) -> frozenset[str]:
+    return frozenset(integer_columns(table))
+
+
+def normalize_record(
+    table: str, record: dict, row: int, rejected: list[RejectedCell]
+) -> dict:
+    """
+    Converts a source record into a row of ``table``.
+
+    Keys are matched to the table's columns through ``normalize_header``, unknown keys are
+    dropped and integer columns are parsed with ``parse_int``. Cells that fail to parse are
+    stored as None and appended to ``rejected``.
+
+    Args:
+        table (str): Destination table.
+        record (dict): Source record, keyed by source headers.
+        row (int): Row number of the record, used for reporting.
+        rejected (list): Collects the rejected cells.
+
+    Returns:
+        dict: The record keyed by the table's column names.
+    """
+    integers = _integer_columns(table)
+
+    normalized = {}
+    for header, value in record.items():
+        column = _column_for(table, header)
+        if column is None:
+            continue
+        if column in integers:
+            try:
+                value = parse_int(value)
+            except ValueError:
+                rejected.append(RejectedCell(table, row, column, value))
+                value = None
+        elif isinstance(value, str):
+            value = value.strip() or None
+        normalized[column] = value
+    return normalized
+
+
+def normalize_records(
+    table: str, records: Iterable[dict], rejected: list[RejectedCell]
+) -> Iterator[dict]:
+    """
+    Lazily runs ``normalize_record`` over records that start on the second row of a sheet.
+    """
+    for row, record in enumerate(records, 2):
+        yield normalize_record(table, record, row, rejected)
+
+
+###
+### Bulk loading
+###
+# A load never touches the live tables until everything has been written: rows go into
+# <table>_shadow with executemany, the shadow tables are checked, and only then swapped in
+# with a rename. All of it is a single transaction, so readers on other connections keep
+# seeing the previous data until the commit and never a half loaded table.
+
+CHUNK_SIZE = 5000  # rows per executemany call
+MAX_ROW_DROP = 0.5  # largest share of a table's rows a load may remove unless forced
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def shadow_name(table: str) -> str:
+    return f"{table}_shadow"
+
+
+def row_hash(table: str, row: dict) -> str:
+    """Hashes the values of a normalized row, in the table's column order."""
+    values = repr([row.get(column) for column in TABLES[table]])
+    return hashlib.blake2b(values.encode(), digest_size=16).hexdigest()
+
+
+def stored_columns(table: str) -> list[str]:
+    return [*TABLES[table], ROW_HASH]
+
+
+def insert_sql(table: str, name: Optional[str] = None, verb: str = "INSERT") -> str:
+    columns = ", ".join(f'"{column}"' for column in stored_columns(table))
+    placeholders = ", ".join("?" for _ in stored_columns(table))
+    return f"{verb} INTO {name or table} ({columns}) VALUES ({placeholders})"
+
+
+def upsert_sql(table: str) -> str:
+    key = primary_key(table)
+    updates = ", ".join(
+        f'"{column}" = excluded."{column}"'
+        for column in stored_columns(table)
+        if column != key
+    )
+    return f'{insert_sql(table)} ON CONFLICT ("{key}") DO UPDATE SET {updates}'
+
+
+def load_shadow(cursor: sqlite3.Cursor, table: str, rows: Iterable[dict]) -> int:
+    """
+    Creates a fresh shadow copy of ``table`` and bulk inserts the rows into it.
+
+    Rows without a primary key are skipped, a later row with the same key replaces an
+    earlier one.
+
+    Returns:
+        int: Number of rows received, skipped ones included.
+    """
+    shadow = shadow_name(table)
+    key = primary_key(table)
+    columns = list(TABLES[table])
+
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+    cursor.execute(create_table_sql(table, shadow))
+
+    received = 0
+
+    def values() -> Iterator[list]:
+        nonlocal received
+        for row in rows:
+            received += 1
+            if row.get(key) is not None:
+                yield [row.get(column) for column in columns] + [row_hash(table, row)]
+
+    insert = insert_sql(table, shadow, "INSERT OR REPLACE")
+    for chunk in chunked(values(), CHUNK_SIZE):
+        cursor.executemany(insert, chunk)
+    return received
+
+
+def check_row_drop(table: str, live: int, remaining: int, force: bool) -> None:
+    """
+    Raises:
+        ValueError: Loading would take ``table`` from ``live`` rows down to
+            ``remaining``, losing more than ``MAX_ROW_DROP`` of them, and the load
+            isn't forced.
+    """
+    if not force and remaining < live * (1 - MAX_ROW_DROP):
+        raise ValueError(
+            f"Refusing to shrink {table} from {live} to {remaining} rows,"
+            " force the load if the source really got smaller"
+        )
+
+
+def swap_in(cursor: sqlite3.Cursor, table: str) -> None:
+    """Replaces ``table`` with its shadow copy."""
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {shadow_name(table)} RENAME TO {table}")
+    for statement in create_indexes_sql(table):
+        cursor.execute(statement)
+
+
+def refresh_derived(cursor: sqlite3.Cursor, report: SyncReport) -> None:
+    """
+    Updates everything computed from the loaded tables: leaderboards, scan history and
+    the name search index. Runs inside the load's transaction.
+    """
+    leaderboard.refresh(cursor)
+    history.record(cursor, report.changed_tables, report.source)
+    if report.changed_tables.intersection(search.SEARCH_TABLES):
+        search.refresh(cursor)
+
+
+def bulk_load(
+    cursor: sqlite3.Cursor,
+    tables: dict[str, Iterable[dict]],
+    report: Optional[SyncReport] = None,
+    force: bool = False,
+) -> SyncReport:
+    """
+    Atomically replaces the contents of the given tables and runs ``refresh_derived``.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the database to load into.
+        tables (dict): Rows to load, keyed by table. Rows can be any iterable, including
+            generators, and are consumed in chunks.
+        report (SyncReport): Report to fill in, a new one is created if omitted.
+        force (bool): Load even if a table loses more than ``MAX_ROW_DROP`` of its
+            rows.
+
+    Returns:
+        SyncReport: Rows loaded and skipped per table.
+
+    Raises:
+        ValueError: A table came out empty, or would lose more than ``MAX_ROW_DROP``
+            of its rows without ``force``. Nothing is changed in that case.
+    """
+    report = report or SyncReport()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for table, rows in tables.items():
+            received = load_shadow(cursor, table, rows)
+            cursor.execute(f"SELECT COUNT(*) FROM {shadow_name(table)}")
+            stored = cursor.fetchone()[0]
+            if stored == 0:
+                raise ValueError(f"Refusing to replace {table} with an empty dataset")
+            report.skipped[table] = received - stored
+
+            if table in BOT_EDITED_TABLES:
+                # rows the bot created itself aren't in the source, carry them over
+                columns = ", ".join(f'"{column}"' for column in stored_columns(table))
+                cursor.execute(
+                    f"INSERT OR IGNORE INTO {shadow_name(table)} ({columns}) "
+                    f"SELECT {columns} FROM {table} WHERE {ROW_HASH} IS NULL"
+                )
+                stored += cursor.rowcount
+
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            check_row_drop(table, cursor.fetchone()[0], stored, force)
+            report.rows[table] = stored
+            report.changed_tables.add(table)
+
+        for table in tables:
+            swap_in(cursor, table)
+        refresh_derived(cursor, report)
+    except Exception:
+        cursor.connection.rollback()
+        raise
+    cursor.connection.commit()
+    return report
+
+
+###
+### Delta loading
+###
+# Instead of rebuilding the tables, a delta load compares the hash of every incoming row
+# with the row_hash stored for its key and only writes the rows that differ. Rows missing
+# from the source are deleted, except rows the bot created itself (see BOT_EDITED_TABLES).
+# Because row_hash is the hash of the last version read from the source, a row edited
+# through the bot keeps its edit until the source row itself changes.
+
+
+def delta_load_table(
+    cursor: sqlite3.Cursor,
+    table: str,
+    rows: Iterable[dict],
+    report: SyncReport,
+    force: bool = False,
+) -> None:
+    key = primary_key(table)
+    cursor.execute(f'SELECT "{key}", {ROW_HASH} FROM {table}')
+    stored_hashes = dict(cursor.fetchall())
+
+    counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+    received = 0
+    seen = set()
+    upsert = upsert_sql(table)
+    pending = []
+
+    for row in rows:
+        received += 1
+        row_key = row.get(key)
+        if row_key is None or row_key in seen:
+            continue
+        seen.add(row_key)
+
+        new_hash = row_hash(table, row)
+        if row_key not in stored_hashes:
+            counts["added"] += 1
+        elif stored_hashes[row_key] != new_hash:
+            counts["changed"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+
+        pending.append([row.get(column) for column in TABLES[table]] + [new_hash])
+        if len(pending) >= CHUNK_SIZE:
+            cursor.executemany(upsert, pending)
+            pending.clear()
+    if pending:
+        cursor.executemany(upsert, pending)
+
+    if not seen:
+        raise ValueError(f"Refusing to replace {table} with an empty dataset")
+
+    removed = [
+        (row_key,)
+        for row_key, stored_hash in stored_hashes.items()
+        if row_key not in seen
+        and (stored_hash is not None or table not in BOT_EDITED_TABLES)
+    ]
+    remaining = len(stored_hashes) + counts["added"] - len(removed)
+    check_row_drop(table, len(stored_hashes), remaining, force)
+    cursor.executemany(f'DELETE FROM {table} WHERE "{key}" = ?', removed)
+    counts["removed"] = len(removed)
+
+    report.rows[table] = remaining
+    report.skipped[table] = received - len(seen)
+    report.changes[table] = counts
+    if counts["added"] or counts["changed"] or counts["removed"]:
+        report.changed_tables.add(table)
+
+
+def delta_load(
+    cursor: sqlite3.Cursor,
+    tables: dict[str, Iterable[dict]],
+    report: Optional[SyncReport] = None,
+    force: bool = False,
+) -> SyncReport:
+    """
+    Applies only the differences between the given rows and the stored tables.
+
+    Takes the same arguments as ``bulk_load`` and runs in a single transaction too. The
+    derived tables are only refreshed if something changed.
+
+    Returns:
+        SyncReport: Rows added, changed, removed and unchanged per table.
+
+    Raises:
+        ValueError: A table came out empty, or would lose more than ``MAX_ROW_DROP``
+            of its rows without ``force``. Nothing is changed in that case.
+    """
+    report = report or SyncReport()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for table, rows in tables.items():
+            delta_load_table(cursor, table, rows, report, force)
+        if report.changed_tables:
+            refresh_derived(cursor, report)
+    except Exception:
+        cursor.connection.rollback()
+        raise
+    cursor.connection.commit()
+    return report
+
+
+LOADERS = {"full": bulk_load, "delta": delta_load}
@@ -0,0 +1,94 @@
+import sqlite3
+
+###
+### Leaderboards precomputed from kvk_top_600
+###
+# The stats tables only change when a sync loads them, so everything /total and /top10
+# show is computed once, right after the load, inside the sync's transaction.
+
+# columns that get a top-N board and per-governor ranks
+RANKED_STATS = ["Power", "T4 Kills", "T5 Kills", "Deaths", "DKP Achieved"]
+# columns summed over the top 300 governors by power for /total
+TOTAL_STATS = ["T4 Kills", "T5 Kills", "Deaths"]
+
+LEADERBOARD_SIZE = 100  # rows kept per board
+TOTALS_TOP = 300  # governors, by power, that /total adds up
+
+TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard_top (
+        stat TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        governor_id INTEGER NOT NULL,
+        governor_name TEXT,
+        score INTEGER,
+        PRIMARY KEY (stat, position)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard_totals (
+        stat TEXT PRIMARY KEY,
+        total INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard_ranks (
+        governor_id INTEGER NOT NULL,
+        stat TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        percentile REAL NOT NULL,
+        PRIMARY KEY (governor_id, stat)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def refresh(cursor: sqlite3.Cursor) -> None:
+    """
+    Recomputes every leaderboard from the current contents of kvk_top_600.
+
+    Runs inside the caller's transaction so readers switch from the old boards to the new
+    ones together with the stats tables.
+    """
+    cursor.execute("DELETE FROM leaderboard_top")
+    cursor.execute("DELETE FROM leaderboard_totals")
+    cursor.execute("DELETE FROM leaderboard_ranks")
+
+    for stat in RANKED_STATS:
+        # stat names come from RANKED_STATS only, never from user input
+        cursor.execute(
+            f"""
+            INSERT INTO leaderboard_top (stat, position, governor_id, governor_name, score)
+            SELECT ?, ROW_NUMBER() OVER (ORDER BY "{stat}" DESC, "Governor ID"),
+                "Governor ID", "Governor Name", "{stat}"
+            FROM kvk_top_600
+            WHERE "{stat}" IS NOT NULL
+            ORDER BY "{stat}" DESC, "Governor ID"
+            LIMIT ?
+            """,
+            (stat, LEADERBOARD_SIZE),
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO leaderboard_ranks (governor_id, stat, rank, percentile)
+            SELECT "Governor ID", ?,
+                RANK() OVER (ORDER BY "{stat}" DESC),
+                ROUND(100.0 * CUME_DIST() OVER (ORDER BY "{stat}"), 1)
+            FROM kvk_top_600
+            WHERE "{stat}" IS NOT NULL
+            """,
+            (stat,),
+        )
+
+    for stat in TOTAL_STATS:
+        cursor.execute(
+            f"""
+            INSERT INTO leaderboard_totals (stat, total)
+            SELECT ?, COALESCE(SUM("{stat}"), 0)
+            FROM (
+                SELECT "{stat}" FROM kvk_top_600
+                ORDER BY "Power" DESC LIMIT ?
+            )
+            """,
+            (stat, TOTALS_TOP),
+        )
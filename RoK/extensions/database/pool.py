@@ -0,0 +1,108 @@
+import asyncio
+import functools
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from metrics import db_query_seconds
+
+T = TypeVar("T")
+
+
+class ConnectionPool:
+    """
+    A small pool of worker threads, each owning its own sqlite3 connection.
+
+    Queries are handed to the pool from the event loop and awaited, so the
+    gateway never blocks on disk I/O and no cursor is ever shared between
+    two interactions.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, timeout: float = 5.0):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # created lazily so importing the module doesn't spawn threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.size, thread_name_prefix="rok-db"
+            )
+        return self._executor
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the connection owned by the calling thread, opening it on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # check_same_thread is off only so close() can run from the main thread
+            connection = sqlite3.connect(
+                self.db_path, timeout=self.timeout, check_same_thread=False
+            )
+            connection.row_factory = sqlite3.Row
+            # WAL lets readers on other threads run while a sync is writing
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def execute(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs ``func(cursor, *args, **kwargs)`` on the calling thread's connection.
+        """
+        cursor = self.connection().cursor()
+        try:
+            return func(cursor, *args, **kwargs)
+        finally:
+            cursor.close()
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs ``func(cursor, *args, **kwargs)`` on a worker thread and awaits the result.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.execute, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+def threaded(func: Callable[..., T]) -> Callable[..., Any]:
+    """
+    Turns a blocking ``method(self, cursor, ...)`` into an awaitable ``method(self, ...)``
+    that runs on ``self.pool``. Every call is timed in ``rok_db_query_seconds``.
+    """
+
+    query = func.__qualname__
+
+    def timed(self, cursor: sqlite3.Cursor, *args, **kwargs):
+        # timed on the worker thread, so waiting for a free worker isn't counted
+        began = time.perf_counter()
+        try:
+            return func(self, cursor, *args, **kwargs)
+        finally:
+            db_query_seconds.observe(time.perf_counter() - began, query=query)
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        return await self.pool.run(functools.partial(timed, self), *args, **kwargs)
+
+    return wrapper
@@ -1,21 +1,80 @@
+import asyncio
+import logging
 import os
 import sqlite3
-from typing import Optional, Union
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional, Union
 
-import gspread
+import aiohttp
 import hikari
 from data_manager import bot_dir
-from oauth2client.service_account import ServiceAccountCredentials
+from metrics import external_seconds, register_cache, sync_seconds
+from extensions.database import history, leaderboard, search
+from extensions.database.cache import SingleFlight, TTLCache, data_generation
+from extensions.database.files import file_records
+from extensions.database.ingest import (
+    RejectedCell,
+    LOADERS,
+    SyncReport,
+    check_headers,
+    normalize_header,
+    normalize_records,
+)
+from extensions.database.pool import ConnectionPool, threaded
+from extensions.database.schema import TABLES
+from extensions.database.sheets import (
+    DRIVE_API,
+    SHEETS_API,
+    SheetsReader,
+    iter_records,
+)
+
+logger = logging.getLogger("rok.database")
 
 db_path = os.path.join(bot_dir, "data", "rok.sqlite3")
-connection = sqlite3.connect(db_path)
-connection.row_factory = sqlite3.Row  # Enable named column access in query results
-cursor = connection.cursor()
+# every worker thread owns its connection; nothing outside the pool touches a cursor
+default_pool = ConnectionPool(db_path)
 
 
-class GetUser:
+# Discord <-> governor links, only change on Id.save / Id.remove or a sync
+link_cache = TTLCache(maxsize=4096, ttl=600)
+register_cache("links", link_cache)
+
+# identical reads running at once share one query, e.g. everyone checking /total
+link_flights = SingleFlight(cache=link_cache)
+read_flights = SingleFlight()
+
+
+def forget_links(discord_id: int, *gov_ids: Optional[int]) -> None:
+    """
+    Drops the cached link lookups of a Discord user and of the given governors.
+    """
+    discord_id = int(discord_id)
+    gov_ids = {int(gov_id) for gov_id in gov_ids if gov_id}
+
+    def is_stale(key) -> bool:
+        if key[0] == "discord_id_from_gov_id":
+            return key[1] in gov_ids
+        return key[1] == discord_id
+
+    link_cache.invalidate(is_stale)
+
+
+class Repository:
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        self.pool = pool or default_pool
+
+
+class GetUser(Repository):
+    @link_cache.cached("gov_user")
+    @link_flights.coalesce
+    @threaded
     def gov_user(
-        self, user_discord_id: int, acc_category: str, acc_type: str
+        self,
+        cursor: sqlite3.Cursor,
+        user_discord_id: int,
+        acc_category: str,
+        acc_type: str,
     ) -> Optional[dict[str, int]]:
         """
         Fetches the Governor ID and Name associated with a Discord user ID based on the type.
@@ -35,7 +94,7 @@ class GetUser:
         id_table = "basic_top_600" if acc_category == "general" else "kvk_top_600"
 
         if acc_type == "main":
-            acc_id_type = "Governer ID"
+            acc_id_type = "Governor ID"
         elif acc_type == "alt":
             acc_id_type = "ALT ID"
         elif acc_type == "farm":
@@ -70,7 +129,12 @@ class GetUser:
         # Return None if no matching governor name is found
         return None
 
-    def gov_ids(self, user_discord_id: int) -> Optional[dict[str, int]]:
+    @link_cache.cached("gov_ids")
+    @link_flights.coalesce
+    @threaded
+    def gov_ids(
+        self, cursor: sqlite3.Cursor, user_discord_id: int
+    ) -> Optional[dict[str, int]]:
         """
         Fetches the main, alt, and farm IDs associated with a Discord user ID.
 
@@ -84,7 +148,7 @@ class GetUser:
         """
         # Query the database for the user's account IDs
         cursor.execute(
-            'SELECT "Governer ID", "ALT ID", "FARM ID" FROM accounts WHERE "Discord ID" = ?',
+            'SELECT "Governor ID", "ALT ID", "FARM ID" FROM accounts WHERE "Discord ID" = ?',
             (user_discord_id,),
         )
         row = cursor.fetchone()
@@ -95,14 +159,18 @@ class GetUser:
 
         # Build and return the dictionary with account IDs
         user_ids = {
-            "main": row["Governer ID"] if row["Governer ID"] else None,
+            "main": row["Governor ID"] if row["Governor ID"] else None,
             "alt": row["ALT ID"] if row["ALT ID"] else None,
             "farm": row["FARM ID"] if row["FARM ID"] else None,
         }
 
         return user_ids
 
-    def discord_username(self, governor_id: int, stats: str) -> str:
+    @link_flights.coalesce
+    @threaded
+    def discord_username(
+        self, cursor: sqlite3.Cursor, governor_id: int, stats: str
+    ) -> Optional[str]:
         """
         Get the Discord username associated with a governor ID.
 
@@ -113,22 +181,21 @@ class GetUser:
         Returns:
             str: Discord username if found, or None.
         """
-        cursor = connection.cursor()
-
-        gov_id_str = str(governor_id)
         id_table = "basic_top_600" if stats == "general" else "kvk_top_600"
 
         # Ensure the column name is correctly referenced without extra quotes
         cursor.execute(
             f'SELECT "Governor Name" FROM {id_table} WHERE "Governor ID" = ?',
-            (gov_id_str,),
+            (int(governor_id),),
         )
-        row = cursor.fetchone()["Governor Name"]
-        cursor.close()
-        return row
+        row = cursor.fetchone()
+        return row["Governor Name"] if row else None
 
+    @link_cache.cached("discord_id_from_gov_id")
+    @link_flights.coalesce
+    @threaded
     def discord_id_from_gov_id(
-        self, gov_id: Union[int, hikari.Snowflake]
+        self, cursor: sqlite3.Cursor, gov_id: Union[int, hikari.Snowflake]
     ) -> int | None:
         """
         Get Discord ID associated with a governor ID.
@@ -140,14 +207,19 @@ class GetUser:
             int: Corresponding Discord ID or None if not found.
         """
         cursor.execute(
-            'SELECT "Discord ID" FROM accounts WHERE "Governer ID" = ?', (str(gov_id),)
+            'SELECT "Discord ID" FROM accounts WHERE "Governor ID" = ?', (int(gov_id),)
         )
         row = cursor.fetchone()
         if row:
             return int(row["Discord ID"])
         return None
 
-    def get_gov_id_from_discord(self, author_id: int) -> int | None:
+    @link_cache.cached("get_gov_id_from_discord")
+    @link_flights.coalesce
+    @threaded
+    def get_gov_id_from_discord(
+        self, cursor: sqlite3.Cursor, author_id: int
+    ) -> int | None:
         """
         Get governor ID associated with a Discord ID.
 
@@ -158,17 +230,21 @@ class GetUser:
             int: Corresponding governor ID or None if not found.
         """
         cursor.execute(
-            'SELECT "Governer ID" FROM accounts WHERE "Discord ID" = ?',
-            (str(author_id),),
+            'SELECT "Governor ID" FROM accounts WHERE "Discord ID" = ?',
+            (int(author_id),),
         )
         row = cursor.fetchone()
-        if row and row["Governer ID"]:
-            return int(row["Governer ID"])
+        if row and row["Governor ID"]:
+            return int(row["Governor ID"])
         return None
 
 
-class KvK:
-    def user_stats(self, gov_id: int, account_category: str) -> Optional[dict]:
+class KvK(Repository):
+    @read_flights.coalesce
+    @threaded
+    def user_stats(
+        self, cursor: sqlite3.Cursor, gov_id: int, account_category: str
+    ) -> Optional[dict]:
         """
         Get KvK stats for a player with the given governor ID.
 
@@ -181,8 +257,11 @@ class KvK:
         """
         id_table = "basic_top_600" if account_category == "general" else "kvk_top_600"
 
-        # Fetch the player's stats from the database
-        cursor.execute(f'SELECT * FROM {id_table} WHERE "Governor ID" = ?', (gov_id,))
+        # Fetch the player's stats from the database, without the sync bookkeeping
+        columns = ", ".join(f'"{column}"' for column in TABLES[id_table])
+        cursor.execute(
+            f'SELECT {columns} FROM {id_table} WHERE "Governor ID" = ?', (gov_id,)
+        )
         row = cursor.fetchone()
         if row is None:
             return None
@@ -190,56 +269,48 @@ class KvK:
         # Convert the row to a dictionary
         return dict(row)
 
-    def kvk_top_300_global_stats(self) -> dict:
+    @read_flights.coalesce
+    @threaded
+    def kvk_top_300_global_stats(self, cursor: sqlite3.Cursor) -> dict:
         """
         Sums top 300 numbers from the 'T4 Kills', 'T5 Kills', and 'Deaths' columns
-        from the 'kvk_top_600'.
+        from the 'kvk_top_600'. The sums are precomputed on every sync.
 
         Returns:
             dict: A dictionary with the column names as keys and their sums as values.
         """
-        cursor.execute(
-            """
-            SELECT 
-                SUM(CAST(REPLACE("T4 Kills", ',', '') AS INTEGER)) AS "T4 Kills",
-                SUM(CAST(REPLACE("T5 Kills", ',', '') AS INTEGER)) AS "T5 Kills",
-                SUM(CAST(REPLACE("Deaths", ',', '') AS INTEGER)) AS "Deaths"
-            FROM (
-                SELECT * FROM kvk_top_600 ORDER BY "Power" DESC LIMIT 300 
-            )
-            """
-        )
-
-        # Fetch the result which will contain the sums of each column
-        result = cursor.fetchone()
+        cursor.execute("SELECT stat, total FROM leaderboard_totals")
+        totals = dict(cursor.fetchall())
 
-        # Construct the dictionary from the fetched result
-        sums = {
-            "T4 Kills": result["T4 Kills"] if result["T4 Kills"] is not None else 0,
-            "T5 Kills": result["T5 Kills"] if result["T5 Kills"] is not None else 0,
-            "Deaths": result["Deaths"] if result["Deaths"] is not None else 0,
-        }
+        return {stat: totals.get(stat, 0) for stat in leaderboard.TOTAL_STATS}
 
-        return sums
-
-    def kvk_top_x_player_stats(self, stat: str) -> dict:
+    @read_flights.coalesce
+    @threaded
+    def kvk_top_x_player_stats(
+        self, cursor: sqlite3.Cursor, stat: str, limit: int = 10
+    ) -> dict:
         """
-        Gets top 10 players in selected category
+        Gets top players in selected category from the precomputed leaderboard.
+
+        Args:
+            stat (str): One of ``leaderboard.RANKED_STATS``.
+            limit (int): Number of players, at most ``leaderboard.LEADERBOARD_SIZE``.
 
         Returns:
-            dict: A dictionary with the top 10 players with assigned chosen stat.
+            dict: A dictionary with the top players with assigned chosen stat.
 
             format: {player_name: {"player_id": player_id, "score": score}}
         """
+        if stat not in leaderboard.RANKED_STATS:
+            raise ValueError(f"Unknown stat: {stat}")
 
-        query = f"""
-        SELECT "Governor Name", "Governor ID", "{stat}"
-        FROM "kvk_top_600"
-        ORDER BY CAST(REPLACE("{stat}", ',', '') AS INTEGER) DESC
-        LIMIT 10
-        """
-
-        cursor.execute(query)
+        cursor.execute(
+            """
+            SELECT governor_name, governor_id, score FROM leaderboard_top
+            WHERE stat = ? ORDER BY position LIMIT ?
+            """,
+            (stat, limit),
+        )
         result = cursor.fetchall()
 
         top_players = {
@@ -249,9 +320,95 @@ class KvK:
 
         return top_players
 
+    @read_flights.coalesce
+    @threaded
+    def user_ranks(self, cursor: sqlite3.Cursor, gov_id: int) -> dict:
+        """
+        Gets a player's precomputed KvK rank in every ranked stat.
+
+        Args:
+            gov_id (int): Governor ID.
+
+        Returns:
+            dict: The player's rank and percentile per stat, empty if the player isn't ranked.
+
+            format: {stat: {"rank": int, "percentile": float}}
+        """
+        cursor.execute(
+            "SELECT stat, rank, percentile FROM leaderboard_ranks WHERE governor_id = ?",
+            (int(gov_id),),
+        )
+        return {
+            stat: {"rank": rank, "percentile": percentile}
+            for stat, rank, percentile in cursor.fetchall()
+        }
+
+    @read_flights.coalesce
+    @threaded
+    def gains(
+        self, cursor: sqlite3.Cursor, gov_id: int, from_scan: int, to_scan: int
+    ) -> Optional[dict]:
+        """
+        Gets how much a player's stats changed between two scans.
+
+        Args:
+            gov_id (int): Governor ID.
+            from_scan (int): ID of the earlier scan.
+            to_scan (int): ID of the later scan.
 
-class Id:
-    def save(
+        Returns:
+            dict: The stats of both scans and their difference, or None if the player is
+                missing from either scan.
+
+            :format: {stat: {"before": int, "after": int, "gain": int}}
+        """
+        return history.gains(cursor, int(gov_id), from_scan, to_scan)
+
+    @read_flights.coalesce
+    @threaded
+    def user_progress(
+        self, cursor: sqlite3.Cursor, gov_id: int, account_category: str, days: int = 7
+    ) -> Optional[dict]:
+        """
+        Gets a player's gains over the last ``days`` days.
+
+        The latest scan that includes the player is compared with the latest one taken at
+        least ``days`` days before now, or with the player's first scan if there is none
+        that old.
+
+        Args:
+            gov_id (int): Governor ID.
+            account_category (str): Type of stats to compare ("general" or "kvk").
+            days (int): How far back to compare.
+
+        Returns:
+            dict: The compared scans and the gains, or None if the player has fewer than
+                two scans.
+
+            :format: {"from": str, "to": str, "gains": {stat: {"before": int, "after": int, "gain": int}}}
+        """
+        gov_id = int(gov_id)
+        table = "basic_top_600" if account_category == "general" else "kvk_top_600"
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+        latest = history.governor_scan(cursor, gov_id, table)
+        baseline = history.governor_scan(
+            cursor, gov_id, table, cutoff.isoformat(timespec="seconds")
+        ) or history.governor_scan(cursor, gov_id, table, earliest=True)
+        if latest is None or baseline["scan_id"] == latest["scan_id"]:
+            return None
+
+        return {
+            "from": baseline["taken_at"],
+            "to": latest["taken_at"],
+            "gains": history.gains(
+                cursor, gov_id, baseline["scan_id"], latest["scan_id"]
+            ),
+        }
+
+
+class Id(Repository):
+    async def save(
         self, user_id: int, user_name: str, governor_id: int, acc_type: str
     ) -> None:
         """
@@ -263,12 +420,35 @@ class Id:
             governor_id (int): Governor ID.
             acctype (str): Account type ('main', 'alt', or 'farm').
         """
-        author_id_str = str(user_id)
-        gov_id_str = str(governor_id)
+        replaced_id = await self._save(user_id, user_name, governor_id, acc_type)
+        forget_links(user_id, replaced_id, governor_id)
+
+    async def remove(self, author_id: int, acc_type: str) -> None:
+        """
+        Remove a governor ID associated with a Discord user ID and account type.
+
+        Args:
+            author_id (int): Discord user ID.
+            acctype (str): Account type ('main', 'alt', or 'farm').
+        """
+        removed_id = await self._remove(author_id, acc_type)
+        forget_links(author_id, removed_id)
+
+    @threaded
+    def _save(
+        self,
+        cursor: sqlite3.Cursor,
+        user_id: int,
+        user_name: str,
+        governor_id: int,
+        acc_type: str,
+    ) -> Optional[int]:
+        """Returns the governor ID the new one replaced, if any."""
         column = None
+        replaced_id = None
 
         if acc_type == "main":
-            column = "Governer ID"
+            column = "Governor ID"
         elif acc_type == "alt":
             column = "ALT ID"
         elif acc_type == "farm":
@@ -279,58 +459,178 @@ class Id:
             cursor.execute('SELECT * FROM accounts WHERE "Discord ID" = ?', (user_id,))
             row = cursor.fetchone()
             if row:
+                replaced_id = row[column]
                 # Update the existing row
                 cursor.execute(
                     f'UPDATE accounts SET "Discord Username" = ?, "{column}" = ? WHERE "Discord ID" = ?',
-                    (user_name, gov_id_str, user_id),
+                    (user_name, int(governor_id), user_id),
                 )
             else:
                 # Insert a new row
                 cursor.execute(
-                    f"INSERT INTO accounts ('Discord ID', '{column}', 'Discord Username') VALUES (?, ?, ?)",
+                    f'INSERT INTO accounts ("Discord ID", "{column}", "Discord Username") VALUES (?, ?, ?)',
                     (
-                        author_id_str,
-                        gov_id_str,
+                        user_id,
+                        int(governor_id),
                         user_name,
                     ),
                 )
-            connection.commit()
-
-    def remove(self, author_id: int, acc_type: str) -> None:
-        """
-        Remove a governor ID associated with a Discord user ID and account type.
-
-        Args:
-            author_id (int): Discord user ID.
-            acctype (str): Account type ('main', 'alt', or 'farm').
-        """
-        author_id_str = str(author_id)
+            cursor.connection.commit()
+        return replaced_id
+
+    @threaded
+    def _remove(
+        self, cursor: sqlite3.Cursor, author_id: int, acc_type: str
+    ) -> Optional[int]:
+        """Returns the governor ID that was unlinked, if any."""
         acc_id_type = None
+        removed_id = None
 
         if acc_type == "main":
-            acc_id_type = "Governer ID"
+            acc_id_type = "Governor ID"
         elif acc_type == "alt":
             acc_id_type = "ALT ID"
         elif acc_type == "farm":
             acc_id_type = "FARM ID"
 
         if acc_id_type:
+            cursor.execute(
+                f'SELECT "{acc_id_type}" FROM accounts WHERE "Discord ID" = ?',
+                (author_id,),
+            )
+            if row := cursor.fetchone():
+                removed_id = row[acc_id_type]
             cursor.execute(
                 f'UPDATE accounts SET "{acc_id_type}" = NULL WHERE "Discord ID" = ?',
-                (author_id_str,),
+                (author_id,),
             )
-            connection.commit()
+            cursor.connection.commit()
+        return removed_id
+
 
+class GovernorSearch(Repository):
+    """
+    Finds governors by name for autocomplete and lookups.
+
+    Prefix lookups are served from an in-memory ``search.NameIndex`` that is rebuilt
+    after a sync changed the data, anything else goes to the FTS5 index.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        super().__init__(pool)
+        self.index = search.NameIndex()
+        self.generation: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    @threaded
+    def load_governors(self, cursor: sqlite3.Cursor) -> list[search.Governor]:
+        return search.load_governors(cursor)
+
+    @threaded
+    def find(
+        self, cursor: sqlite3.Cursor, text: str, limit: int = 25
+    ) -> list[search.Governor]:
+        """
+        Finds governors whose name contains ``text``, at least 3 characters of it.
+
+        Returns:
+            list: Matching governors, best matches first.
+        """
+        return search.search(cursor, text, limit)
+
+    async def refresh_index(self) -> search.NameIndex:
+        """Rebuilds the prefix index if the data changed since it was built."""
+        async with self._lock:
+            if self.generation != data_generation.value:
+                generation = data_generation.value
+                governors = await self.load_governors()
+                self.index = await asyncio.to_thread(search.NameIndex, governors)
+                self.generation = generation
+        return self.index
+
+    async def complete(self, text: str, limit: int = 25) -> list[search.Governor]:
+        """
+        Suggests governors for partially typed text, for slash command autocomplete.
 
-class GSheet:
-    def __init__(self, sheet_id: str):
+        Names, words of names and IDs starting with ``text`` come first, then names that
+        contain it anywhere.
+
+        Returns:
+            list: At most ``limit`` governors.
+        """
+        index = await self.refresh_index()
+        found = {governor.id: governor for governor in index.complete(text, limit)}
+        if len(found) < limit and len(text.strip()) >= 3:
+            for governor in await self.find(text, limit):
+                found.setdefault(governor.id, governor)
+        return list(found.values())[:limit]
+
+
+class SyncState(Repository):
+    """
+    Remembers the last sync in the sync_state table.
+
+    :keys: "revision" (the spreadsheet version that was synced), "synced_at" (ISO 8601)
+    """
+
+    @threaded
+    def load(self, cursor: sqlite3.Cursor) -> dict[str, str]:
+        cursor.execute("SELECT key, value FROM sync_state")
+        return dict(cursor.fetchall())
+
+    @threaded
+    def save(self, cursor: sqlite3.Cursor, **values: Optional[str]) -> None:
+        cursor.executemany(
+            """
+            INSERT INTO sync_state (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            """,
+            values.items(),
+        )
+        cursor.connection.commit()
+
+    async def restore(self) -> None:
+        """Puts the stored time of the last sync back on ``data_generation``."""
+        if synced_at := (await self.load()).get("synced_at"):
+            data_generation.synced_at = datetime.fromisoformat(synced_at)
+
+    async def mark_synced(self, **values: Optional[str]) -> None:
+        """Records that the data matches its source as of now, along with ``values``."""
+        data_generation.synced_at = datetime.now(timezone.utc)
+        await self.save(synced_at=data_generation.synced_at.isoformat(), **values)
+
+
+class GSheet(Repository):
+    # worksheet title: table it is synced into
+    worksheets = {
+        "ACCOUNTS LINKED TO BOTS": "accounts",
+        "🤖BASIC STATS TOP 600 13-02-2024": "basic_top_600",
+        "KVK 2 STATS TOP 600": "kvk_top_600",
+    }
+
+    def __init__(
+        self,
+        sheet_id: str,
+        pool: Optional[ConnectionPool] = None,
+        base_url: str = SHEETS_API,
+        drive_url: str = DRIVE_API,
+    ):
+        super().__init__(pool)
         self.sheet_id = sheet_id
-        self.sheet = self.setup_google_sheets()
+        # nothing is read or imported until the first sync needs a token
+        self.credentials = None
+        self.reader = SheetsReader(sheet_id, self.access_token, base_url, drive_url)
+        self.state = SyncState(self.pool)
+        # manual and scheduled syncs must not overlap
+        self.lock = asyncio.Lock()
 
     def setup_google_sheets(self):
         """
-        Initializes the Google Sheets API client using credentials from a JSON file.
+        Loads the Google service account credentials from a JSON file.
         """
+        # oauth2client is slow to import and only needed for syncing
+        from oauth2client.service_account import ServiceAccountCredentials
+
         credentials_path = os.path.join(bot_dir, "data", "creds.json")
 
         # Set the Google Sheets API scope and authorize
@@ -338,187 +638,174 @@ class GSheet:
             "https://spreadsheets.google.com/feeds",
             "https://www.googleapis.com/auth/drive",
         ]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            credentials_path, scope
-        )
-        client = gspread.authorize(creds)
+        return ServiceAccountCredentials.from_json_keyfile_name(credentials_path, scope)
 
-        # Open the Google Sheet by ID
-        return client.open_by_key(self.sheet_id)
+    async def access_token(self) -> str:
+        if self.credentials is None:
+            self.credentials = await asyncio.to_thread(self.setup_google_sheets)
+        # the credentials cache their token and only refresh it once it has expired,
+        # but they do so over blocking HTTP
+        token = await asyncio.to_thread(self.credentials.get_access_token)
+        return token.access_token
 
     def normalize_headers(self, headers):
         """Normalize headers by stripping spaces and converting to lowercase."""
-        return [header.strip().lower() for header in headers]
+        return [normalize_header(header) for header in headers]
+
+    def sheet_records(
+        self,
+        worksheet_title: str,
+        table: str,
+        values: list[list],
+        rejected: list[RejectedCell],
+    ) -> Iterator[dict]:
+        """
+        Checks a worksheet's headers and converts its rows into rows of ``table``.
 
-    def fetch_sheet_data(self, worksheet_title: str, expected_headers: list):
-        worksheet = self.sheet.worksheet(worksheet_title)
-        records = worksheet.get_all_records()
+        Numbers such as "1,234,567" are parsed into integers here, once per sync, so queries
+        can sort and sum on the stored values directly. Parsing is lazy, rows are converted
+        as the loader consumes them.
 
-        # Normalize the expected headers and the headers in the sheet
-        normalized_expected_headers = self.normalize_headers(expected_headers)
-        normalized_sheet_headers = self.normalize_headers(records[0].keys())
+        Args:
+            worksheet_title (str): Title of the worksheet.
+            table (str): Table the records are meant for.
+            values (list): The worksheet's rows, header row first.
+            rejected (list): Collects the cells that could not be parsed.
 
-        # Check if all expected headers are present in the sheet headers
-        missing_headers = set(normalized_expected_headers) - set(
-            normalized_sheet_headers
-        )
-        if missing_headers:
-            raise ValueError(f"Missing headers in the sheet: {missing_headers}")
-
-        # Only keep records with expected headers
-        filtered_records = []
-        for record in records:
-            filtered_record = {
-                k: v
-                for k, v in record.items()
-                if k.strip().lower() in normalized_expected_headers
-            }
-            filtered_records.append(filtered_record)
-
-        return filtered_records
-
-    def sync_db_with_sheets(self):
-        create_accounts_table = """
-        CREATE TABLE IF NOT EXISTS accounts (
-            "Discord ID" TEXT,
-            "Discord Username" TEXT,
-            "Governor ID" TEXT,
-            "ALT ID" TEXT,
-            "FARM ID" TEXT
-        );
-        """
-
-        create_basic_top_600_table = """
-        CREATE TABLE IF NOT EXISTS basic_top_600 (
-            "Governor Name" TEXT,
-            "Governor ID" TEXT,
-            "Power" INTEGER,
-            "Kill Points" INTEGER,
-            "Deaths" INTEGER,
-            "T4 Kills" INTEGER,
-            "T5 Kills" INTEGER,
-            "Alliance" TEXT
-        );
-        """
-
-        create_kvk_top_600_table = """
-        CREATE TABLE IF NOT EXISTS kvk_top_600 (
-            "Governor Name" TEXT,
-            "Governor ID" TEXT,
-            "Power" INTEGER,
-            "Rank" INTEGER,
-            "DKP Required" INTEGER,
-            "DKP Achieved" INTEGER,
-            "Deaths" INTEGER,
-            "T4 Kills" INTEGER,
-            "T5 Kills" INTEGER,
-            "Alliance" TEXT
-        );
-        """
-
-        cursor.execute("DROP TABLE IF EXISTS accounts;")
-        cursor.execute("DROP TABLE IF EXISTS basic_top_600;")
-        cursor.execute("DROP TABLE IF EXISTS kvk_top_600;")
-
-        cursor.execute(create_accounts_table)
-        cursor.execute(create_basic_top_600_table)
-        cursor.execute(create_kvk_top_600_table)
-
-        # Define the expected headers for each sheet
-        accounts_headers = [
-            "Discord ID",
-            "Discord Username",
-            "Governor ID",
-            "ALT ID",
-            "FARM ID",
-        ]
-        basic_top_600_headers = [
-            "Governor Name",
-            "Governor ID",
-            "Power",
-            "Kill Points",
-            "Deaths",
-            "T4 Kills",
-            "T5 Kills",
-            "Alliance",
-        ]
-        kvk_top_600_headers = [
-            "Governor Name",
-            "Governor ID",
-            "Power",
-            "Rank",
-            "DKP Required",
-            "DKP Achieved",
-            "Deaths",
-            "T4 Kills",
-            "T5 Kills",
-            "Alliance",
-        ]
+        Returns:
+            Iterator: The worksheet's records keyed by the table's column names.
+        """
+        check_headers(worksheet_title, table, values[0] if values else [])
+        return normalize_records(table, iter_records(values), rejected)
 
-        # Fetch and insert data for "accounts" table
-        accounts_data = self.fetch_sheet_data(
-            "ACCOUNTS LINKED TO BOTS", accounts_headers
-        )
-        for row in accounts_data:
-            cursor.execute(
-                """
-                INSERT INTO accounts ("Discord ID", "Discord Username", "Governor ID", "ALT ID", "FARM ID")
-                VALUES (?, ?, ?, ?, ?)
-            """,
-                (
-                    row.get("Discord ID"),
-                    row.get("Discord Username"),
-                    row.get("Governor ID"),
-                    row.get("ALT ID"),
-                    row.get("FARM ID"),
-                ),
-            )
+    async def revision(self) -> Optional[str]:
+        """
+        Returns:
+            str: The spreadsheet's current version, or None if Drive couldn't tell.
+        """
+        try:
+            return await self.reader.revision()
+        except aiohttp.ClientError as error:
+            logger.warning("Couldn't read the spreadsheet's version: %s", error)
+            return None
 
-        # Fetch and insert data for "basic_top_600" table
-        basic_top_600_data = self.fetch_sheet_data(
-            "🤖BASIC STATS TOP 600 13-02-2024", basic_top_600_headers
-        )
-        for row in basic_top_600_data:
-            cursor.execute(
-                """
-                INSERT INTO basic_top_600 ("Governor Name", "Governor ID", "Power", "Kill Points", "Deaths", "T4 Kills", "T5 Kills", "Alliance")
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    row.get("Governor Name"),
-                    row.get("Governor ID"),
-                    row.get("Power"),
-                    row.get("Kill Points"),
-                    row.get("Deaths"),
-                    row.get("T4 Kills"),
-                    row.get("T5 Kills"),
-                    row.get("Alliance"),
-                ),
-            )
+    async def sync_if_changed(self, mode: str = "delta") -> Optional[SyncReport]:
+        """
+        Syncs only if the spreadsheet was edited since the last sync.
 
-        # Fetch and insert data for "kvk_top_600" table
-        kvk_top_600_data = self.fetch_sheet_data(
-            "KVK 2 STATS TOP 600", kvk_top_600_headers
-        )
-        for row in kvk_top_600_data:
-            cursor.execute(
-                """
-                INSERT INTO kvk_top_600 ("Governor Name", "Governor ID", "Power", "Rank", "DKP Required", "DKP Achieved", "Deaths", "T4 Kills", "T5 Kills", "Alliance")
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    row.get("Governor Name"),
-                    row.get("Governor ID"),
-                    row.get("Power"),
-                    row.get("Rank"),
-                    row.get("DKP Required"),
-                    row.get("DKP Achieved"),
-                    row.get("Deaths"),
-                    row.get("T4 Kills"),
-                    row.get("T5 Kills"),
-                    row.get("Alliance"),
-                ),
-            )
+        Returns:
+            SyncReport: The sync's report, or None if the spreadsheet is unchanged.
+        """
+        async with self.lock:
+            revision = await self.revision()
+            synced_revision = (await self.state.load()).get("revision")
+            if revision is not None and revision == synced_revision:
+                # still in sync, which is worth as much as a sync that changed nothing
+                await self.state.mark_synced()
+                return None
+            return await self._sync(mode, revision)
+
+    async def sync_db_with_sheets(
+        self, mode: str = "delta", force: bool = False
+    ) -> SyncReport:
+        """
+        Brings the database up to date with the spreadsheet.
+
+        Args:
+            mode (str): "delta" only writes the rows that changed since the last sync,
+                "full" rebuilds the tables. Either way links made with /linkme are kept.
+            force (bool): Sync even if a table loses more than half of its rows, for
+                when the spreadsheet really got smaller.
+
+        Returns:
+            SyncReport: Rows per table, what changed and the cells that were rejected.
+        """
+        async with self.lock:
+            return await self._sync(mode, await self.revision(), force)
+
+    async def _sync(
+        self, mode: str, revision: Optional[str], force: bool = False
+    ) -> SyncReport:
+        # the revision is read before the download, an edit made while downloading
+        # leaves the stored revision behind and gets picked up by the next check
+        load = LOADERS[mode]
+        with sync_seconds.time(source="sheets", mode=mode):
+            with external_seconds.time(call="sheets.batch_get"):
+                values = await self.reader.batch_get(list(self.worksheets))
+
+            report = SyncReport(source="Google Sheets")
+            data = {
+                table: self.sheet_records(
+                    worksheet_title, table, values[worksheet_title], report.rejected
+                )
+                for worksheet_title, table in self.worksheets.items()
+            }
+            # rows stream from the parser into the loader on a pool thread
+            report = await self.pool.run(load, data, report, force)
+        logger.info("Database synced with Google Sheets:\n%s", report.summary())
+
+        logger.debug("Link cache before sync: %s", link_cache.stats())
+        if report.changed_tables:
+            # everything cached against the old data is stale now
+            data_generation.bump()
+
+        await self.state.mark_synced(revision=revision)
+        return report
+
+    async def close(self) -> None:
+        await self.reader.close()
+
+
+class ScanImport(Repository):
+    """
+    Loads scan exports (CSV or XLSX) into the database, for when Google Sheets isn't an
+    option. Files go through the same normalization and loaders as a sheets sync.
+    """
+
+    def __init__(
+        self, pool: Optional[ConnectionPool] = None, lock: Optional[asyncio.Lock] = None
+    ):
+        super().__init__(pool)
+        # share GSheet's lock so an import and a sync never overlap
+        self.lock = lock or asyncio.Lock()
+
+    @staticmethod
+    def load_file(
+        cursor: sqlite3.Cursor,
+        path: str,
+        table: Optional[str],
+        mode: str,
+        force: bool = False,
+    ) -> SyncReport:
+        # reading, parsing and loading all happen here, on the pool thread
+        report = SyncReport(source=os.path.basename(path))
+        table, records = file_records(path, table, report.rejected)
+        return LOADERS[mode](cursor, {table: records}, report, force)
+
+    async def import_file(
+        self,
+        path: str,
+        table: Optional[str] = None,
+        mode: str = "delta",
+        force: bool = False,
+    ) -> SyncReport:
+        """
+        Loads a CSV or XLSX scan export into one table.
 
-        connection.commit()
-        print("Database has been synced with Google Sheets.")
+        Args:
+            path (str): Path of the file, its header row must cover every column of the table.
+            table (str): Table to load into, detected from the headers if omitted.
+            mode (str): "delta" or "full", like ``GSheet.sync_db_with_sheets``.
+            force (bool): Load even if the table loses more than half of its rows.
+
+        Returns:
+            SyncReport: Rows per table, what changed and the cells that were rejected.
+        """
+        async with self.lock:
+            with sync_seconds.time(source="file", mode=mode):
+                report = await self.pool.run(self.load_file, path, table, mode, force)
+        logger.info("Imported %s:\n%s", os.path.basename(path), report.summary())
+
+        if report.changed_tables:
+            data_generation.bump()
+        return report
@@ -0,0 +1,439 @@
+import sqlite3
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+###
+### Tables
+###
+# Column order here is the column order of the tables and of every insert.
+
+TABLES: dict[str, dict[str, str]] = {
+    "accounts": {
+        "Discord ID": "INTEGER PRIMARY KEY",
+        "Discord Username": "TEXT",
+        "Governor ID": "INTEGER",
+        "ALT ID": "INTEGER",
+        "FARM ID": "INTEGER",
+    },
+    "basic_top_600": {
+        "Governor ID": "INTEGER PRIMARY KEY",
+        "Governor Name": "TEXT",
+        "Power": "INTEGER",
+        "Kill Points": "INTEGER",
+        "Deaths": "INTEGER",
+        "T4 Kills": "INTEGER",
+        "T5 Kills": "INTEGER",
+        "Alliance": "TEXT",
+    },
+    "kvk_top_600": {
+        "Governor ID": "INTEGER PRIMARY KEY",
+        "Governor Name": "TEXT",
+        "Power": "INTEGER",
+        "Rank": "INTEGER",
+        "DKP Required": "INTEGER",
+        "DKP Achieved": "INTEGER",
+        "Deaths": "INTEGER",
+        "T4 Kills": "INTEGER",
+        "T5 Kills": "INTEGER",
+        "Alliance": "TEXT",
+    },
+}
+
+# Secondary indexes, one per column that is looked up or ranked on
+INDEXES: dict[str, list[str]] = {
+    "accounts": ["Governor ID", "ALT ID", "FARM ID"],
+    "basic_top_600": ["Power", "Kill Points", "Deaths", "T4 Kills", "T5 Kills"],
+    "kvk_top_600": [
+        "Power",
+        "Rank",
+        "DKP Achieved",
+        "Deaths",
+        "T4 Kills",
+        "T5 Kills",
+    ],
+}
+
+
+# Every table also has a row_hash column: the hash of the row as it was last read from
+# the spreadsheet, which lets a delta sync skip rows that didn't change. Rows the bot
+# created itself, like /linkme links in accounts, have no hash.
+ROW_HASH = "row_hash"
+
+# tables the bot writes to on its own, a sync never deletes their rows without a hash
+BOT_EDITED_TABLES = {"accounts"}
+
+
+def primary_key(table: str) -> str:
+    """Returns the primary key column of a table."""
+    for column, column_type in TABLES[table].items():
+        if "PRIMARY KEY" in column_type:
+            return column
+    raise KeyError(f"{table} has no primary key")
+
+
+def integer_columns(table: str) -> list[str]:
+    """Returns the columns of a table with INTEGER affinity."""
+    return [
+        column
+        for column, column_type in TABLES[table].items()
+        if column_type.startswith("INTEGER")
+    ]
+
+
+def index_name(table: str, column: str) -> str:
+    return f"idx_{table}_{column.lower().replace(' ', '_')}"
+
+
+def create_table_sql(table: str, name: Optional[str] = None) -> str:
+    """
+    Builds the CREATE TABLE statement of a table.
+
+    Args:
+        table (str): Table defined in ``TABLES``.
+        name (str): Name to create the table under, defaults to ``table``.
+    """
+    columns = ",\n    ".join(
+        [f'"{column}" {column_type}' for column, column_type in TABLES[table].items()]
+        + [f"{ROW_HASH} TEXT"]
+    )
+    return f"CREATE TABLE IF NOT EXISTS {name or table} (\n    {columns}\n);"
+
+
+def create_indexes_sql(table: str, name: Optional[str] = None) -> list[str]:
+    """
+    Builds the CREATE INDEX statements of a table.
+
+    Args:
+        table (str): Table defined in ``TABLES``.
+        name (str): Table the indexes are created on, defaults to ``table``.
+    """
+    return [
+        f'CREATE INDEX IF NOT EXISTS {index_name(table, column)} ON {name or table} ("{column}")'
+        for column in INDEXES[table]
+    ]
+
+
+###
+### Migrations
+###
+# Each migration runs once, in order, inside its own transaction. The number of
+# applied migrations is stored in sqlite's user_version. Never edit or reorder a
+# migration that has shipped, append a new one instead.
+#
+# A migration holds its own SQL, as it was when it shipped, and never calls the live
+# schema, leaderboard, history or search code: those keep changing, a migration must
+# not change with them.
+
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> list[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+_TYPED_SCHEMA_SQL = {
+    "accounts": [
+        """
+        CREATE TABLE IF NOT EXISTS accounts (
+            "Discord ID" INTEGER PRIMARY KEY,
+            "Discord Username" TEXT,
+            "Governor ID" INTEGER,
+            "ALT ID" INTEGER,
+            "FARM ID" INTEGER
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_accounts_governor_id ON accounts ("Governor ID")',
+        'CREATE INDEX IF NOT EXISTS idx_accounts_alt_id ON accounts ("ALT ID")',
+        'CREATE INDEX IF NOT EXISTS idx_accounts_farm_id ON accounts ("FARM ID")',
+    ],
+    "basic_top_600": [
+        """
+        CREATE TABLE IF NOT EXISTS basic_top_600 (
+            "Governor ID" INTEGER PRIMARY KEY,
+            "Governor Name" TEXT,
+            "Power" INTEGER,
+            "Kill Points" INTEGER,
+            "Deaths" INTEGER,
+            "T4 Kills" INTEGER,
+            "T5 Kills" INTEGER,
+            "Alliance" TEXT
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_basic_top_600_power ON basic_top_600 ("Power")',
+        'CREATE INDEX IF NOT EXISTS idx_basic_top_600_kill_points ON basic_top_600 ("Kill Points")',
+        'CREATE INDEX IF NOT EXISTS idx_basic_top_600_deaths ON basic_top_600 ("Deaths")',
+        'CREATE INDEX IF NOT EXISTS idx_basic_top_600_t4_kills ON basic_top_600 ("T4 Kills")',
+        'CREATE INDEX IF NOT EXISTS idx_basic_top_600_t5_kills ON basic_top_600 ("T5 Kills")',
+    ],
+    "kvk_top_600": [
+        """
+        CREATE TABLE IF NOT EXISTS kvk_top_600 (
+            "Governor ID" INTEGER PRIMARY KEY,
+            "Governor Name" TEXT,
+            "Power" INTEGER,
+            "Rank" INTEGER,
+            "DKP Required" INTEGER,
+            "DKP Achieved" INTEGER,
+            "Deaths" INTEGER,
+            "T4 Kills" INTEGER,
+            "T5 Kills" INTEGER,
+            "Alliance" TEXT
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_kvk_top_600_power ON kvk_top_600 ("Power")',
+        'CREATE INDEX IF NOT EXISTS idx_kvk_top_600_rank ON kvk_top_600 ("Rank")',
+        'CREATE INDEX IF NOT EXISTS idx_kvk_top_600_dkp_achieved ON kvk_top_600 ("DKP Achieved")',
+        'CREATE INDEX IF NOT EXISTS idx_kvk_top_600_deaths ON kvk_top_600 ("Deaths")',
+        'CREATE INDEX IF NOT EXISTS idx_kvk_top_600_t4_kills ON kvk_top_600 ("T4 Kills")',
+        'CREATE INDEX IF NOT EXISTS idx_kvk_top_600_t5_kills ON kvk_top_600 ("T5 Kills")',
+    ],
+}
+
+
+def _typed_schema(cursor: sqlite3.Cursor) -> None:
+    """
+    Replaces the untyped, unindexed tables created by the old sync with the typed schema,
+    carrying over any existing rows.
+    """
+    for table, statements in _TYPED_SCHEMA_SQL.items():
+        legacy_columns = _columns(cursor, table)
+        if legacy_columns:
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+
+        for statement in statements:
+            cursor.execute(statement)
+
+        if not legacy_columns:
+            continue
+
+        # old accounts tables were created with a misspelled "Governer ID"
+        renamed = {"Governor ID": "Governer ID"}
+        columns, values = [], []
+        cursor.execute(f"PRAGMA table_info({table})")
+        for _, column, column_type, _, _, is_key in cursor.fetchall():
+            if is_key:
+                key = column
+            source = column if column in legacy_columns else renamed.get(column)
+            if source not in legacy_columns:
+                continue
+            columns.append(f'"{column}"')
+            if column_type == "INTEGER":
+                values.append(
+                    f"CAST(NULLIF(REPLACE(\"{source}\", ',', ''), '') AS INTEGER)"
+                )
+            else:
+                values.append(f'"{source}"')
+
+        if f'"{key}"' in columns:
+            cursor.execute(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                f"SELECT {', '.join(values)} FROM {table}_legacy "
+                f"WHERE NULLIF(\"{key}\", '') IS NOT NULL"
+            )
+        cursor.execute(f"DROP TABLE {table}_legacy")
+
+
+def _leaderboards(cursor: sqlite3.Cursor) -> None:
+    """Adds the precomputed leaderboard tables and fills them from the current data."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_top (
+            stat TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            governor_id INTEGER NOT NULL,
+            governor_name TEXT,
+            score INTEGER,
+            PRIMARY KEY (stat, position)
+        ) WITHOUT ROWID
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_totals (
+            stat TEXT PRIMARY KEY,
+            total INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_ranks (
+            governor_id INTEGER NOT NULL,
+            stat TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            percentile REAL NOT NULL,
+            PRIMARY KEY (governor_id, stat)
+        ) WITHOUT ROWID
+        """
+    )
+
+    for stat in ("Power", "T4 Kills", "T5 Kills", "Deaths", "DKP Achieved"):
+        cursor.execute(
+            f"""
+            INSERT INTO leaderboard_top (stat, position, governor_id, governor_name, score)
+            SELECT ?, ROW_NUMBER() OVER (ORDER BY "{stat}" DESC, "Governor ID"),
+                "Governor ID", "Governor Name", "{stat}"
+            FROM kvk_top_600
+            WHERE "{stat}" IS NOT NULL
+            ORDER BY "{stat}" DESC, "Governor ID"
+            LIMIT 100
+            """,
+            (stat,),
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO leaderboard_ranks (governor_id, stat, rank, percentile)
+            SELECT "Governor ID", ?,
+                RANK() OVER (ORDER BY "{stat}" DESC),
+                ROUND(100.0 * CUME_DIST() OVER (ORDER BY "{stat}"), 1)
+            FROM kvk_top_600
+            WHERE "{stat}" IS NOT NULL
+            """,
+            (stat,),
+        )
+    for stat in ("T4 Kills", "T5 Kills", "Deaths"):
+        cursor.execute(
+            f"""
+            INSERT INTO leaderboard_totals (stat, total)
+            SELECT ?, COALESCE(SUM("{stat}"), 0)
+            FROM (
+                SELECT "{stat}" FROM kvk_top_600
+                ORDER BY "Power" DESC LIMIT 300
+            )
+            """,
+            (stat,),
+        )
+
+
+def _row_hashes(cursor: sqlite3.Cursor) -> None:
+    """Adds the row_hash column used by delta syncs, existing rows start without one."""
+    for table in ("accounts", "basic_top_600", "kvk_top_600"):
+        if "row_hash" not in _columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN row_hash TEXT")
+
+
+def _sync_state(cursor: sqlite3.Cursor) -> None:
+    """Adds the key/value table that remembers the last sync."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _scan_history(cursor: sqlite3.Cursor) -> None:
+    """Adds the scan history tables, the data already loaded becomes the first scans."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scans (
+            scan_id INTEGER PRIMARY KEY,
+            source_table TEXT NOT NULL,
+            taken_at TEXT NOT NULL,
+            source TEXT
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scans_source_table ON scans (source_table, taken_at)"
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_stats (
+            governor_id INTEGER NOT NULL,
+            scan_id INTEGER NOT NULL REFERENCES scans (scan_id),
+            "Power" INTEGER,
+            "Kill Points" INTEGER,
+            "DKP Achieved" INTEGER,
+            "Deaths" INTEGER,
+            "T4 Kills" INTEGER,
+            "T5 Kills" INTEGER,
+            PRIMARY KEY (governor_id, scan_id)
+        ) WITHOUT ROWID
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scan_stats_scan_id ON scan_stats (scan_id)"
+    )
+
+    taken_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    snapshots = {
+        "basic_top_600": '"Power", "Kill Points", "Deaths", "T4 Kills", "T5 Kills"',
+        "kvk_top_600": '"Power", "DKP Achieved", "Deaths", "T4 Kills", "T5 Kills"',
+    }
+    for table, columns in snapshots.items():
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if not cursor.fetchone()[0]:
+            continue
+        cursor.execute(
+            "INSERT INTO scans (source_table, taken_at, source) VALUES (?, ?, ?)",
+            (table, taken_at, "existing data"),
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO scan_stats (governor_id, scan_id, {columns})
+            SELECT "Governor ID", ?, {columns} FROM {table}
+            """,
+            (cursor.lastrowid,),
+        )
+
+
+def _name_search(cursor: sqlite3.Cursor) -> None:
+    """Adds the governor name search index and fills it from the current data."""
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS governor_names USING fts5(
+            name,
+            governor_id UNINDEXED,
+            tokenize = 'trigram'
+        )
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO governor_names (governor_id, name)
+        SELECT "Governor ID", "Governor Name" FROM kvk_top_600
+        WHERE "Governor Name" IS NOT NULL
+        UNION ALL
+        SELECT "Governor ID", "Governor Name" FROM basic_top_600
+        WHERE "Governor Name" IS NOT NULL
+            AND "Governor ID" NOT IN (SELECT "Governor ID" FROM kvk_top_600)
+        """
+    )
+
+
+MIGRATIONS: list[Callable[[sqlite3.Cursor], None]] = [
+    _typed_schema,
+    _leaderboards,
+    _row_hashes,
+    _sync_state,
+    _scan_history,
+    _name_search,
+]
+
+
+def migrate(cursor: sqlite3.Cursor) -> int:
+    """
+    Applies every migration newer than the database's version.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the database to migrate.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            cursor.connection.rollback()
+            raise
+        cursor.connection.commit()
+
+    return max(version, len(MIGRATIONS))
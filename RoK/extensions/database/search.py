@@ -0,0 +1,124 @@
+import bisect
+import sqlite3
+from itertools import islice
+from typing import Iterable, NamedTuple
+
+###
+### Governor name search
+###
+# Names are indexed twice, both rebuilt whenever a sync changes the stats tables:
+# - governor_names, an FTS5 trigram table that finds a name from any 3+ characters of it
+# - NameIndex, a sorted in-memory list that answers prefix lookups for autocomplete
+#   without touching the database
+
+SEARCH_TABLES = ("kvk_top_600", "basic_top_600")  # earlier tables win on duplicate IDs
+
+TABLES_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS governor_names USING fts5(
+        name,
+        governor_id UNINDEXED,
+        tokenize = 'trigram'
+    )
+    """,
+]
+
+
+class Governor(NamedTuple):
+    id: int
+    name: str
+
+
+def governors_sql() -> str:
+    """Selects the ID and name of every governor in the stats tables, once per ID."""
+    selects = []
+    for number, table in enumerate(SEARCH_TABLES):
+        select = (
+            f'SELECT "Governor ID", "Governor Name" FROM {table} '
+            'WHERE "Governor Name" IS NOT NULL'
+        )
+        for earlier in SEARCH_TABLES[:number]:
+            select += f' AND "Governor ID" NOT IN (SELECT "Governor ID" FROM {earlier})'
+        selects.append(select)
+    return " UNION ALL ".join(selects)
+
+
+def refresh(cursor: sqlite3.Cursor) -> None:
+    """Rebuilds governor_names, inside the caller's transaction like leaderboard.refresh."""
+    cursor.execute("DELETE FROM governor_names")
+    cursor.execute(f"INSERT INTO governor_names (governor_id, name) {governors_sql()}")
+
+
+def fts_query(text: str) -> str:
+    """Quotes user input as a single FTS5 phrase so operators in it are taken literally."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search(cursor: sqlite3.Cursor, text: str, limit: int = 25) -> list[Governor]:
+    """
+    Finds governors whose name contains ``text``, best matches first.
+
+    The trigram index needs at least 3 characters, shorter text matches nothing.
+    """
+    if len(text.strip()) < 3:
+        return []
+    cursor.execute(
+        """
+        SELECT governor_id, name FROM governor_names
+        WHERE governor_names MATCH ? ORDER BY rank LIMIT ?
+        """,
+        (fts_query(text.strip()), limit),
+    )
+    return [Governor(int(governor_id), name) for governor_id, name in cursor.fetchall()]
+
+
+def load_governors(cursor: sqlite3.Cursor) -> list[Governor]:
+    cursor.execute(governors_sql())
+    return [Governor(int(governor_id), name) for governor_id, name in cursor.fetchall()]
+
+
+class NameIndex:
+    """
+    Prefix lookups over governor names and IDs, built once per data generation.
+
+    Every name is indexed whole and by each of its words, so "dragon" finds
+    "[ABC] Dragon Slayer". Lookups are a binary search plus a short scan.
+    """
+
+    def __init__(self, governors: Iterable[Governor] = ()):
+        self.governors: dict[int, Governor] = {}
+        keys = []
+        for governor in governors:
+            self.governors[governor.id] = governor
+            name = governor.name.casefold()
+            keys.append((name, governor.id))
+            keys.extend((word, governor.id) for word in name.split()[1:])
+        keys.sort()
+        self._keys = keys
+        self._ids = sorted(str(governor_id) for governor_id in self.governors)
+
+    def __len__(self) -> int:
+        return len(self.governors)
+
+    def complete(self, prefix: str, limit: int = 25) -> list[Governor]:
+        """
+        Returns:
+            list: Up to ``limit`` governors whose name, a word of it, or ID starts
+                with ``prefix``, in alphabetical order.
+        """
+        prefix = prefix.strip().casefold()
+        found: dict[int, Governor] = {}
+
+        if prefix.isdigit():
+            start = bisect.bisect_left(self._ids, prefix)
+            for governor_id in islice(self._ids, start, None):
+                if len(found) >= limit or not governor_id.startswith(prefix):
+                    break
+                found[int(governor_id)] = self.governors[int(governor_id)]
+
+        start = bisect.bisect_left(self._keys, (prefix,))
+        for key, governor_id in islice(self._keys, start, None):
+            if len(found) >= limit or not key.startswith(prefix):
+                break
+            found.setdefault(governor_id, self.governors[governor_id])
+        return list(found.values())
@@ -1,14 +1,22 @@
 import logging
+import time
+
 import hikari
 import lightbulb
 
 plugin = lightbulb.Plugin("listeners")
 
+logger = logging.getLogger("rok.startup")
+
 
 @plugin.listener(lightbulb.events.LightbulbStartedEvent)
 async def on_ready(event: lightbulb.LightbulbStartedEvent) -> None:
-    print("Bot started, I think")
-    logging.info("RoK-bot has started!")
+    logger.info("RoK-bot has started!")
+    if started_at := event.app.d.get("started_at"):
+        logger.info(
+            "Ready %.0f ms after the process started",
+            (time.perf_counter() - started_at) * 1000,
+        )
 
 
 #
@@ -40,7 +48,11 @@ async def on_error(event: lightbulb.CommandErrorEvent) -> None:
         )
     )
 
-    print(event.exception.original)
+    logging.getLogger("rok.commands").error(
+        "Command %s failed",
+        event.context.command.qualname,
+        exc_info=event.exception.original,
+    )
 
 
 def load(bot):
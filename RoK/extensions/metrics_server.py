@@ -0,0 +1,163 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import hikari
+import lightbulb
+from aiohttp import web
+from data_manager import config
+from extensions.database.cache import data_generation
+from metrics import Gauge, command_errors, command_seconds, registry
+
+plugin = lightbulb.Plugin("metrics_server")
+
+logger = logging.getLogger("rok.metrics")
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "host": "127.0.0.1",
+    "port": 9108,
+    # /health reports not ready when the data is older than this, null disables it
+    "max_data_age_seconds": None,
+}
+
+# context id: when the command was invoked, oldest first. A command that neither
+# completes nor fails leaves its entry behind, entries are dropped after MAX_PENDING_AGE
+# or once there are more than MAX_PENDING.
+_invoked_at: dict[int, float] = {}
+MAX_PENDING = 1000
+MAX_PENDING_AGE = 900  # seconds, how long an interaction token stays valid
+_runner: Optional[web.AppRunner] = None
+
+
+def settings() -> dict:
+    return {**DEFAULT_SETTINGS, **config().get("metrics", {})}
+
+
+def data_age() -> Optional[float]:
+    """Seconds since the data was last synced, None if it never was."""
+    if data_generation.synced_at is None:
+        return None
+    return (datetime.now(timezone.utc) - data_generation.synced_at).total_seconds()
+
+
+def heartbeat() -> dict:
+    latency = plugin.app.heartbeat_latency
+    return {(): None if latency != latency else latency}  # NaN until the first beat
+
+
+registry.register(
+    Gauge(
+        "rok_gateway_heartbeat_seconds",
+        "Gateway heartbeat latency.",
+        collect=heartbeat,
+    )
+)
+registry.register(
+    Gauge(
+        "rok_data_age_seconds",
+        "Seconds since the last sync.",
+        collect=lambda: {(): data_age()},
+    )
+)
+registry.register(
+    Gauge(
+        "rok_data_generation",
+        "Number of syncs that changed the data since the bot started.",
+        collect=lambda: {(): data_generation.value},
+    )
+)
+
+
+def command_labels(context: lightbulb.Context) -> tuple[str, str]:
+    kind = "slash" if isinstance(context, lightbulb.SlashContext) else "prefix"
+    return kind, context.command.qualname
+
+
+@plugin.listener(lightbulb.CommandInvocationEvent)
+async def on_invocation(event: lightbulb.CommandInvocationEvent) -> None:
+    now = time.perf_counter()
+    while _invoked_at and (
+        len(_invoked_at) >= MAX_PENDING
+        or next(iter(_invoked_at.values())) < now - MAX_PENDING_AGE
+    ):
+        del _invoked_at[next(iter(_invoked_at))]
+    _invoked_at[id(event.context)] = now
+
+
+@plugin.listener(lightbulb.CommandCompletionEvent)
+async def on_completion(event: lightbulb.CommandCompletionEvent) -> None:
+    if (began := _invoked_at.pop(id(event.context), None)) is not None:
+        kind, name = command_labels(event.context)
+        command_seconds.observe(time.perf_counter() - began, kind=kind, name=name)
+
+
+@plugin.listener(lightbulb.CommandErrorEvent)
+async def on_command_error(event: lightbulb.CommandErrorEvent) -> None:
+    # CommandNotFound comes with a context but no command
+    if event.context is None or event.context.command is None:
+        return
+    kind, name = command_labels(event.context)
+    command_errors.inc(kind=kind, name=name)
+    if (began := _invoked_at.pop(id(event.context), None)) is not None:
+        command_seconds.observe(time.perf_counter() - began, kind=kind, name=name)
+
+
+async def metrics_route(request: web.Request) -> web.Response:
+    return web.Response(
+        text=registry.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def health_route(request: web.Request) -> web.Response:
+    """
+    Liveness and readiness in one: 200 when the bot is connected and its data is fresh
+    enough, 503 otherwise. The body says why.
+    """
+    max_age = settings()["max_data_age_seconds"]
+    age = data_age()
+    latency = plugin.app.heartbeat_latency
+    connected = latency == latency  # NaN while disconnected
+    fresh = max_age is None or (age is not None and age <= max_age)
+
+    body = {
+        "ready": connected and fresh,
+        "connected": connected,
+        "heartbeat_latency_seconds": latency if connected else None,
+        "data_fresh": fresh,
+        "data_age_seconds": age,
+        "synced_at": (
+            data_generation.synced_at.isoformat() if data_generation.synced_at else None
+        ),
+        "data_generation": data_generation.value,
+    }
+    return web.json_response(body, status=200 if body["ready"] else 503)
+
+
+@plugin.listener(lightbulb.LightbulbStartedEvent)
+async def on_started(event: lightbulb.LightbulbStartedEvent) -> None:
+    global _runner
+    options = settings()
+    if not options["enabled"]:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_route)
+    app.router.add_get("/health", health_route)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, options["host"], options["port"]).start()
+    logger.info("Serving metrics on http://%s:%s", options["host"], options["port"])
+
+
+@plugin.listener(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent) -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+
+
+def load(bot) -> None:
+    bot.add_plugin(plugin)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import random
+from typing import Optional
+
+import hikari
+import lightbulb
+from data_manager import config
+from extensions.rok.slash_commands import gsheet_as_database_sin
+
+plugin = lightbulb.Plugin("auto_sync")
+
+logger = logging.getLogger("rok.sync")
+
+MIN_INTERVAL = 60  # seconds, keeps a bad config from hammering the APIs
+
+_task: Optional[asyncio.Task] = None
+
+
+def settings() -> dict:
+    """
+    Returns:
+        dict: The "auto_sync" section of config.json with defaults filled in.
+
+        :format: {"enabled": bool, "interval_seconds": int, "jitter_seconds": int, "mode": str}
+    """
+    return {
+        "enabled": False,
+        "interval_seconds": 3600,
+        "jitter_seconds": 300,
+        "mode": "delta",
+        **config().get("auto_sync", {}),
+    }
+
+
+async def sync_loop(interval: float, jitter: float, mode: str) -> None:
+    while True:
+        delay = max(MIN_INTERVAL, interval + random.uniform(-jitter, jitter))
+        await asyncio.sleep(delay)
+        try:
+            report = await gsheet_as_database_sin.sync_if_changed(mode)
+        except Exception:
+            logger.exception("Scheduled sync failed")
+            continue
+        # a sync that ran logs its own report
+        if report is None:
+            logger.info("Spreadsheet unchanged, skipped the scheduled sync")
+
+
+@plugin.listener(lightbulb.LightbulbStartedEvent)
+async def on_started(event: lightbulb.LightbulbStartedEvent) -> None:
+    global _task
+    # embeds show when the data was last synced, even across restarts
+    await gsheet_as_database_sin.state.restore()
+
+    options = settings()
+    if not options["enabled"]:
+        return
+    _task = asyncio.create_task(
+        sync_loop(
+            options["interval_seconds"], options["jitter_seconds"], options["mode"]
+        )
+    )
+    logger.info(
+        "Auto sync every %ss (±%ss), %s mode",
+        options["interval_seconds"],
+        options["jitter_seconds"],
+        options["mode"],
+    )
+
+
+@plugin.listener(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent) -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def load(bot) -> None:
+    bot.add_plugin(plugin)
@@ -1,11 +1,23 @@
+import asyncio
+import copy
+from datetime import datetime
+from typing import Optional
+
 import hikari
 import lightbulb
 from data_manager import config
+from metrics import external_seconds, register_cache
+from extensions.database.cache import Generation, TTLCache, data_generation
 from extensions.database.rok import KvK
 
 kvk = KvK()
 bot_config = config()["bot"]
 
+# built embeds, entries go stale as soon as a sync changes the data
+embed_cache = TTLCache(maxsize=1024, ttl=3600)
+register_cache("embeds", embed_cache)
+_MISSING = object()
+
 # def int_len(n) -> int:
 #     if n > 0:
 #         digits = int(math.log10(n)) + 1
@@ -16,6 +28,67 @@ bot_config = config()["bot"]
 #     return digits
 
 
+class UserResolver:
+    """
+    Resolves Discord users for embeds from the users fetched recently, or with a REST
+    call. The gateway cache isn't asked, it holds no users with the lean cache settings
+    of rok-bot.py.
+
+    Concurrent lookups of the same user share one REST call.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 900):
+        # users don't change with syncs, so they get a generation of their own
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, generation=Generation())
+        self.rest_calls = 0
+        self._in_flight: dict[int, asyncio.Future] = {}
+
+    async def fetch(self, app, user_id: int) -> hikari.User:
+        """
+        Args:
+            app: Anything with ``rest``, like the bot or a miru client.
+            user_id (int): Discord ID of the user.
+
+        Returns:
+            hikari.User: The user.
+
+        Raises:
+            hikari.NotFoundError: The user doesn't exist.
+        """
+        user_id = int(user_id)
+        if user := self.cache.get(user_id):
+            return user
+        while future := self._in_flight.get(user_id):
+            # None when the call was cancelled, the lookup is then made again
+            if user := await asyncio.shield(future):
+                return user
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[user_id] = future
+        try:
+            self.rest_calls += 1
+            with external_seconds.time(call="rest.fetch_user"):
+                user = await app.rest.fetch_user(user_id)
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # retrieve it so a lookup nobody else waited for doesn't log a warning
+            future.exception()
+            raise
+        else:
+            self.cache.set(user_id, user)
+            future.set_result(user)
+            return user
+        finally:
+            del self._in_flight[user_id]
+
+
+user_resolver = UserResolver()
+register_cache("users", user_resolver.cache)
+
+
 async def is_admin(ctx: lightbulb.SlashContext):
     admin_role_id = bot_config["owner_id"]
     if ctx.member:
@@ -26,10 +99,22 @@ async def is_admin(ctx: lightbulb.SlashContext):
         return False
 
 
+def format_number(value, default: str = "0") -> str:
+    """Formats a stored stat as "1,234,567", or returns default if it's missing."""
+    if value is None:
+        return default
+    if isinstance(value, int):
+        return format(value, ",")
+    return str(value)
+
+
 async def stats_embed(user: hikari.User, gov_id: int, acc_category: str):
     """
     Builds an embed from individual player stats based on the stats type.
 
+    The stats part is cached per governor and data generation, only the footer is
+    built per request.
+
     Args:
         user (hikari.User): Hikari user object.
         gov_id (int): Governor ID.
@@ -38,9 +123,14 @@ async def stats_embed(user: hikari.User, gov_id: int, acc_category: str):
     Returns:
         hikari.Embed or None: The constructed embed or None if no stats are found.
     """
-    player_stats = kvk.user_stats(gov_id, acc_category)
+    key = ("stats", int(gov_id), acc_category)
+    embed = embed_cache.get(key, _MISSING)
+    if embed is _MISSING:
+        snapshot = embed_cache.snapshot()
+        embed = await build_stats_embed(gov_id, acc_category)
+        embed_cache.set(key, embed, snapshot)
 
-    if player_stats is None:
+    if embed is None:
         return None
 
     userpfp = (
@@ -48,6 +138,28 @@ async def stats_embed(user: hikari.User, gov_id: int, acc_category: str):
         or "https://media.discordapp.net/attachments/1076154233197445201/1127610236744773792/discord-black-icon-1.png"
     )
 
+    # Set the footer on a copy, the cached embed is shared between requests
+    embed = copy.copy(embed)
+    footer = f"Requested by @{user.username}"
+    if data_generation.synced_at is not None:
+        footer += f"       Updated: {data_generation.synced_at:%d %B %Y %H:%M} UTC"
+    embed.set_footer(text=footer, icon=userpfp)
+
+    return embed
+
+
+async def build_stats_embed(gov_id: int, acc_category: str) -> Optional[hikari.Embed]:
+    """
+    Builds the part of ``stats_embed`` that only depends on the player's stats.
+
+    Returns:
+        hikari.Embed or None: The embed without a footer or None if no stats are found.
+    """
+    player_stats = await kvk.user_stats(gov_id, acc_category)
+
+    if player_stats is None:
+        return None
+
     # Create the embed object
     embed = hikari.Embed(color=hikari.Color.from_rgb(0, 200, 250))
 
@@ -58,22 +170,24 @@ async def stats_embed(user: hikari.User, gov_id: int, acc_category: str):
             f"**Governor**: {player_stats.get('Governor Name', '0')}\n"
             f"**Governor ID**: {player_stats.get('Governor ID', '0')}\n"
             f"**Alliance**: {player_stats.get('Alliance', 'Unknown')}\n"
-            f"**Power**: {player_stats.get('Power', '0')}\n"
-            f"**Kill Points**: {player_stats.get('Kill Points', '0')}\n"
+            f"**Power**: {format_number(player_stats.get('Power'))}\n"
+            f"**Kill Points**: {format_number(player_stats.get('Kill Points'))}\n"
         )
         embed.description = description
         embed.add_field(
             name="<:4_:1277422678470430750> T4 KILLS",
-            value=player_stats.get("T4 Kills", "0"),
+            value=format_number(player_stats.get("T4 Kills")),
             inline=True,
         )
         embed.add_field(
             name="\n<:5_:1277422745960841276> T5 KILLS",
-            value=player_stats.get("T5 Kills", "0"),
+            value=format_number(player_stats.get("T5 Kills")),
             inline=True,
         )
         embed.add_field(
-            name="\n:skull: DEATHS", value=player_stats.get("Deaths", "0"), inline=True
+            name="\n:skull: DEATHS",
+            value=format_number(player_stats.get("Deaths")),
+            inline=True,
         )
     elif acc_category == "kvk":
         # KvK stats embed
@@ -81,43 +195,125 @@ async def stats_embed(user: hikari.User, gov_id: int, acc_category: str):
         description = (
             f"**Governor**: {player_stats.get('Governor Name', '0')}\n"
             f"**Alliance**: {player_stats.get('Alliance', 'Unknown')}\n"
-            f"**Power**: {player_stats.get('Power', '0')}\n"
+            f"**Power**: {format_number(player_stats.get('Power'))}\n"
             f"**Governor ID**: {player_stats.get('Governor ID', '0')}\n"
         )
+        if power_rank := (await kvk.user_ranks(gov_id)).get("Power"):
+            description += (
+                f"**Power Rank**: #{power_rank['rank']} "
+                f"({power_rank['percentile']} percentile)\n"
+            )
         embed.description = description
         embed.add_field(
             name=":trophy: Rank",
-            value=player_stats.get("Rank", "Unranked"),
+            value=format_number(player_stats.get("Rank"), "Unranked"),
             inline=True,
         )
         embed.add_field(
             name="DKP Required",
-            value=player_stats.get("DKP Required", "0"),
+            value=format_number(player_stats.get("DKP Required")),
             inline=True,
         )
         embed.add_field(
             name="DKP Achieved",
-            value=player_stats.get("DKP Achieved", "0"),
+            value=format_number(player_stats.get("DKP Achieved")),
             inline=True,
         )
         embed.add_field(
             name="<:4_:1277422678470430750> T4 KILLS",
-            value=player_stats.get("T4 Kills", "0"),
+            value=format_number(player_stats.get("T4 Kills")),
             inline=True,
         )
         embed.add_field(
             name="\n<:5_:1277422745960841276> T5 KILLS",
-            value=player_stats.get("T5 Kills", "0"),
+            value=format_number(player_stats.get("T5 Kills")),
             inline=True,
         )
         embed.add_field(
-            name="\n:skull: DEATHS", value=player_stats.get("Deaths", "0"), inline=True
+            name="\n:skull: DEATHS",
+            value=format_number(player_stats.get("Deaths")),
+            inline=True,
         )
 
-    # Set the footer
-    embed.set_footer(
-        text=f"Requested by @{user.username}       Updated: 19 August 2024 ",
-        icon=userpfp,
-    )
+    return embed
+
+
+async def leaderboard_embeds(category: str, limit: int = 10) -> dict[str, hikari.Embed]:
+    """
+    Builds the leaderboard of a category in both of Top10View's renderings.
+
+    The embeds are cached and shared until the data changes, don't modify them.
+
+    Args:
+        category (str): One of ``leaderboard.RANKED_STATS``.
+        limit (int): Number of players, at most 25, the number of fields an embed holds.
+
+    Returns:
+        dict: The embed listing nicknames and the one listing governor IDs.
+
+        :format: {"nicknames": hikari.Embed, "ids": hikari.Embed}
+    """
+    key = ("leaderboard", category, limit)
+    if (embeds := embed_cache.get(key)) is not None:
+        return embeds
+
+    snapshot = embed_cache.snapshot()
+    top_players = await kvk.kvk_top_x_player_stats(category, limit)
+    embeds = {}
+    for state in ("nicknames", "ids"):
+        embed = hikari.Embed(
+            title=f"Top {limit} players by {category}",
+            color=hikari.Color.from_rgb(0, 250, 0),
+        )
+        for x, (player, details) in enumerate(top_players.items(), 1):
+            embed.add_field(
+                f"{x}: {player if state == 'nicknames' else details['player_id']}",
+                f"<:4_:1277422678470430750> {format_number(details['score'])}",
+            )
+        embeds[state] = embed
+
+    embed_cache.set(key, embeds, snapshot)
+    return embeds
+
 
+async def progress_embed(
+    user: hikari.User, gov_id: int, acc_category: str, days: int
+) -> Optional[hikari.Embed]:
+    """
+    Builds an embed of a player's gains over the last ``days`` days.
+
+    Args:
+        user (hikari.User): Hikari user object.
+        gov_id (int): Governor ID.
+        acc_category (str): Compare 'general' or 'kvk' scans.
+        days (int): How far back to compare.
+
+    Returns:
+        hikari.Embed or None: The constructed embed or None if there's nothing to compare.
+    """
+    progress = await kvk.user_progress(gov_id, acc_category, days)
+    if progress is None:
+        return None
+
+    player_stats = await kvk.user_stats(gov_id, acc_category) or {}
+    since = datetime.fromisoformat(progress["from"])
+    until = datetime.fromisoformat(progress["to"])
+
+    embed = hikari.Embed(
+        title="Progress :chart_with_upwards_trend:",
+        description=(
+            f"**Governor**: {player_stats.get('Governor Name', gov_id)}\n"
+            f"**Governor ID**: {gov_id}\n"
+            f"**Between**: {since:%d %B %Y} and {until:%d %B %Y}\n"
+        ),
+        color=hikari.Color.from_rgb(0, 200, 250),
+    )
+    for stat, values in progress["gains"].items():
+        embed.add_field(
+            name=stat,
+            value=f"{values['gain']:+,}\n-# {format_number(values['before'])} → "
+            f"{format_number(values['after'])}",
+            inline=True,
+        )
+    embed.set_footer(text=f"Requested by @{user.username}", icon=user.avatar_url)
     return embed
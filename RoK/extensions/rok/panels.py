@@ -0,0 +1,353 @@
+import logging
+from typing import Awaitable, Callable, Optional
+
+import hikari
+import lightbulb
+from data_manager import config
+from metrics import command_errors, command_seconds
+from extensions.database.rok import GetUser, Id
+from extensions.rok.functions import leaderboard_embeds, stats_embed
+from extensions.rok.responses import ResponseBudget
+
+###
+### Stateless panels
+###
+# The button panels of /stats, /linkme, /unlinkme, /top10 and !mystats, without a miru
+# view behind them. Everything a button needs is in its custom_id:
+#
+#   rok:<panel>:<field>:<field>...     e.g. rok:stats:<author id>:kvk:main
+#
+# and one listener answers every press by rebuilding the next page from those fields.
+# Nothing is kept in memory per open panel, panels never expire, and they keep working
+# after a restart and on any process running the bot.
+#
+# Used instead of the miru menus when "stateless_panels" is enabled in the
+# "interactions" section of config.json. This plugin is always loaded, so panels sent
+# while it was enabled keep working after it's turned off.
+
+plugin = lightbulb.Plugin("panels")
+
+logger = logging.getLogger("rok.commands")
+
+get_rok_user = GetUser()
+user_id = Id()
+
+enabled: bool = bool(config().get("interactions", {}).get("stateless_panels", False))
+
+PREFIX = "rok"
+SEPARATOR = ":"
+MAX_CUSTOM_ID = 100  # characters, Discord's limit
+
+Page = dict  # keyword arguments of a message response: content, embed, components
+PanelHandler = Callable[["PanelContext", list[str]], Awaitable[Page]]
+# panel name: (handler(ctx, fields), whether the first field is the owner's ID,
+# field counts the handler accepts)
+panels: dict[str, tuple[PanelHandler, bool, tuple[int, ...]]] = {}
+
+EXPIRED = "This panel has expired, please run the command again."
+
+
+def custom_id(panel: str, *fields) -> str:
+    value = SEPARATOR.join((PREFIX, panel, *map(str, fields)))
+    if len(value) > MAX_CUSTOM_ID:
+        raise ValueError(f"custom_id longer than {MAX_CUSTOM_ID} characters: {value}")
+    return value
+
+
+def parse(value: str) -> Optional[tuple[str, list[str]]]:
+    """
+    Returns:
+        tuple: ``(panel, fields)`` of a custom_id made by ``custom_id``, None for any
+            other custom_id.
+    """
+    prefix, _, rest = value.partition(SEPARATOR)
+    if prefix != PREFIX or not rest:
+        return None
+    panel, *fields = rest.split(SEPARATOR)
+    return panel, fields
+
+
+def panel(
+    name: str, *field_counts: int, owned: bool = True
+) -> Callable[[PanelHandler], PanelHandler]:
+    """
+    Registers the handler of a panel's buttons.
+
+    Args:
+        name (str): Panel name, the second part of its custom_ids.
+        *field_counts (int): Numbers of fields the handler accepts. Presses with any
+            other number, from an older layout, are answered as expired.
+        owned (bool): Whether the first field is the ID of the only user allowed to
+            press the buttons.
+    """
+
+    def decorator(func: PanelHandler) -> PanelHandler:
+        panels[name] = (func, owned, field_counts)
+        return func
+
+    return decorator
+
+
+def buttons(*specs: tuple[str, str, hikari.ButtonStyle]) -> list:
+    """
+    Args:
+        *specs (tuple): ``(label, custom_id, style)`` of each button.
+
+    Returns:
+        list: A single action row holding the buttons.
+    """
+    row = hikari.impl.MessageActionRowBuilder()
+    for label, button_id, style in specs:
+        row.add_interactive_button(style, button_id, label=label)
+    return [row]
+
+
+def account_buttons(panel_name: str, *fields) -> list:
+    return buttons(
+        (
+            "Main Account",
+            custom_id(panel_name, *fields, "main"),
+            hikari.ButtonStyle.PRIMARY,
+        ),
+        (
+            "Alt Account",
+            custom_id(panel_name, *fields, "alt"),
+            hikari.ButtonStyle.SECONDARY,
+        ),
+        (
+            "Farm Account",
+            custom_id(panel_name, *fields, "farm"),
+            hikari.ButtonStyle.SECONDARY,
+        ),
+    )
+
+
+def yes_no_buttons(panel_name: str, *fields) -> list:
+    return buttons(
+        ("Yes", custom_id(panel_name, *fields, "yes"), hikari.ButtonStyle.PRIMARY),
+        ("No", custom_id(panel_name, *fields, "no"), hikari.ButtonStyle.DANGER),
+    )
+
+
+class PanelContext:
+    """A button press on a stateless panel, with what ResponseBudget needs to defer it."""
+
+    def __init__(self, interaction: hikari.ComponentInteraction):
+        self.interaction = interaction
+        self.user = interaction.user
+        self.issued_response = False
+
+    async def defer(self, response_type: hikari.ResponseType) -> None:
+        if self.issued_response:
+            raise RuntimeError("Interaction was already responded to.")
+        self.issued_response = True
+        await self.interaction.create_initial_response(response_type)
+
+    async def update(self, page: Page) -> None:
+        """Replaces the panel's message with ``page``."""
+        if self.issued_response:
+            await self.interaction.edit_initial_response(**page)
+            return
+        self.issued_response = True
+        await self.interaction.create_initial_response(
+            hikari.ResponseType.MESSAGE_UPDATE, **page
+        )
+
+    async def respond_ephemeral(self, content: str) -> None:
+        if self.issued_response:
+            await self.interaction.execute(content, flags=hikari.MessageFlag.EPHEMERAL)
+            return
+        self.issued_response = True
+        await self.interaction.create_initial_response(
+            hikari.ResponseType.MESSAGE_CREATE,
+            content,
+            flags=hikari.MessageFlag.EPHEMERAL,
+        )
+
+
+@plugin.listener(hikari.InteractionCreateEvent)
+async def on_interaction(event: hikari.InteractionCreateEvent) -> None:
+    interaction = event.interaction
+    if not isinstance(interaction, hikari.ComponentInteraction):
+        return
+    if (parsed := parse(interaction.custom_id)) is None:
+        return  # a miru view's component
+    name, fields = parsed
+    ctx = PanelContext(interaction)
+    if (registered := panels.get(name)) is None:
+        await ctx.respond_ephemeral(EXPIRED)
+        return
+    handler, owned, field_counts = registered
+    if len(fields) not in field_counts:
+        await ctx.respond_ephemeral(EXPIRED)
+        return
+    if owned and fields[0] != str(interaction.user.id):
+        await ctx.respond_ephemeral("You're not allowed to interact with this panel")
+        return
+
+    metric_name = f"panel.{name}"
+    budget = ResponseBudget(ctx, metric_name)
+    try:
+        with command_seconds.time(kind="component", name=metric_name):
+            page = await budget.run(handler(ctx, fields))
+            budget.responded()
+            await ctx.update(page)
+    except ValueError:
+        # a field that doesn't parse, from an older layout
+        command_errors.inc(kind="component", name=metric_name)
+        logger.warning("Panel %s got a bad custom_id %s", name, interaction.custom_id)
+        await ctx.respond_ephemeral(EXPIRED)
+    except Exception:
+        command_errors.inc(kind="component", name=metric_name)
+        logger.exception("Panel %s failed on %s", name, interaction.custom_id)
+
+
+###
+### /stats and !mystats
+###
+# rok:stats:<author>:<category>               -> account buttons
+# rok:stats:<author>:<category>:<account>     -> stats embed
+
+
+def stats_start(author_id: int) -> Page:
+    return {
+        "content": "Choose your account",
+        "components": buttons(
+            (
+                "General",
+                custom_id("stats", author_id, "general"),
+                hikari.ButtonStyle.PRIMARY,
+            ),
+            ("KvK", custom_id("stats", author_id, "kvk"), hikari.ButtonStyle.SUCCESS),
+        ),
+    }
+
+
+async def stats_page(user: hikari.User, acc_category: str, acc_type: str) -> Page:
+    """The stats of one of ``user``'s linked accounts, like StatsPostScreen."""
+    gov_user = await get_rok_user.gov_user(user.id, acc_category, acc_type)
+    if not gov_user:
+        return {"content": f"No {acc_type} account registered", "components": []}
+    embed = await stats_embed(user, gov_user["id"], acc_category)
+    return {"content": None, "embed": embed, "components": []}
+
+
+@panel("stats", 2, 3)
+async def stats_panel(ctx: PanelContext, fields: list[str]) -> Page:
+    author, acc_category, *account = fields
+    if not account:
+        return {
+            "content": "Please specify",
+            "components": account_buttons("stats", author, acc_category),
+        }
+    return await stats_page(ctx.user, acc_category, account[0])
+
+
+###
+### /linkme
+###
+# rok:linkme:<author>:<governor id>:yes|no    -> account buttons
+# rok:linkme:<author>:<governor id>:<account> -> linked
+
+
+def linkme_start(author_id: int, username: str, governor_id: int) -> Page:
+    return {
+        "content": "Please confirm if this is your account?",
+        "embed": hikari.Embed(
+            description=f"Username: {username}\nGovernor ID: {governor_id}",
+            color=(0, 255, 0),
+        ),
+        "components": yes_no_buttons("linkme", author_id, governor_id),
+    }
+
+
+@panel("linkme", 3)
+async def linkme_panel(ctx: PanelContext, fields: list[str]) -> Page:
+    author, governor_id, choice = fields
+    if choice == "no":
+        return {
+            "content": "Confirmation declined by the user.",
+            "embed": None,
+            "components": [],
+        }
+    if choice == "yes":
+        return {
+            "content": "Please choose your account type",
+            "embed": None,
+            "components": account_buttons("linkme", author, governor_id),
+        }
+    await user_id.save(ctx.user.id, ctx.user.username, int(governor_id), choice)
+    return {"content": "You have been successfully registered.", "components": []}
+
+
+###
+### /unlinkme
+###
+# rok:unlinkme:<author>:<account>             -> confirmation
+# rok:unlinkme:<author>:<account>:yes|no      -> unlinked
+
+
+def unlinkme_start(author_id: int) -> Page:
+    return {
+        "content": "Which account would you like to unlink?",
+        "components": account_buttons("unlinkme", author_id),
+    }
+
+
+@panel("unlinkme", 2, 3)
+async def unlinkme_panel(ctx: PanelContext, fields: list[str]) -> Page:
+    author, acc_type, *choice = fields
+    if choice == ["yes"]:
+        await user_id.remove(ctx.user.id, acc_type)
+        return {
+            "content": f"{acc_type.capitalize()} account unlinked",
+            "embed": None,
+            "components": [],
+        }
+    if choice == ["no"]:
+        return {"content": "Account unlinking cancelled", "components": []}
+
+    linked_ids = await get_rok_user.gov_ids(ctx.user.id)
+    if not linked_ids or not linked_ids[acc_type]:
+        return {"content": "Account not found", "components": []}
+    embed = hikari.Embed(
+        title="Are you sure you want to unlink this account?",
+        description=f"Username: {ctx.user.username}\nGovernor ID: {linked_ids[acc_type]}",
+        color=hikari.Color.from_rgb(250, 0, 0),
+    )
+    return {
+        "content": None,
+        "embed": embed,
+        "components": yes_no_buttons("unlinkme", author, acc_type),
+    }
+
+
+###
+### /top10
+###
+# rok:top10:<limit>:<shown rendering>:<category>, anyone can press it
+
+
+async def top10_page(category: str, limit: int, toggle_state: str) -> Page:
+    embeds = await leaderboard_embeds(category, limit)
+    return {
+        "embed": embeds[toggle_state],
+        "components": buttons(
+            (
+                "Toggle names",
+                custom_id("top10", limit, toggle_state, category),
+                hikari.ButtonStyle.PRIMARY,
+            )
+        ),
+    }
+
+
+@panel("top10", 3, owned=False)
+async def top10_panel(ctx: PanelContext, fields: list[str]) -> Page:
+    limit, toggle_state, category = fields
+    toggle_state = "ids" if toggle_state == "nicknames" else "nicknames"
+    return await top10_page(category, int(limit), toggle_state)
+
+
+def load(bot) -> None:
+    bot.add_plugin(plugin)
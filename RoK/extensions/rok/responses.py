@@ -0,0 +1,119 @@
+import asyncio
+import time
+from contextlib import suppress
+from typing import Awaitable, Optional, TypeVar, Union
+
+import hikari
+import lightbulb
+import miru
+from data_manager import config
+from metrics import deadline_misses, interaction_deferrals, response_seconds
+
+###
+### Response deadline
+###
+# Discord fails an interaction that has no response 3 seconds after it was sent. Work done
+# before the first response (database queries, REST calls) runs under a ResponseBudget:
+# when it is still running once the budget is spent, the interaction is deferred, which
+# shows "thinking..." (slash commands) or keeps the message as is (components), and the
+# response becomes an edit of the deferred one when the work is done.
+
+DEADLINE = 3.0  # seconds
+MAX_BUDGET = 2.5  # leaves the defer request itself time to reach Discord
+
+T = TypeVar("T")
+
+
+def settings() -> dict:
+    """
+    Returns:
+        dict: The "interactions" section of config.json with defaults filled in.
+
+        :format: {"response_budget_seconds": float}
+    """
+    return {"response_budget_seconds": 2.0, **config().get("interactions", {})}
+
+
+response_budget = min(float(settings()["response_budget_seconds"]), MAX_BUDGET)
+
+
+class ResponseBudget:
+    """
+    Defers an interaction whose first response isn't ready within the budget.
+
+    Time is counted from the creation of the budget, create it first thing in the
+    handler. Slash commands are deferred with DEFERRED_MESSAGE_CREATE, anything else is
+    a component context (miru's or a stateless panel's) deferred with
+    DEFERRED_MESSAGE_UPDATE.
+    """
+
+    def __init__(
+        self,
+        ctx: Union[lightbulb.SlashContext, miru.ViewContext],
+        name: str,
+        budget: Optional[float] = None,
+    ):
+        self.ctx = ctx
+        self.kind = "slash" if isinstance(ctx, lightbulb.SlashContext) else "component"
+        self.name = name
+        self.budget = response_budget if budget is None else budget
+        self.started = time.perf_counter()
+        self.deferred = False
+        self.responded_after: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def responded(self) -> None:
+        """Records the time to the first response, call it right before sending it."""
+        if self.responded_after is not None:
+            return
+        self.responded_after = self.elapsed()
+        response_seconds.observe(self.responded_after, kind=self.kind, name=self.name)
+        if self.responded_after > DEADLINE:
+            deadline_misses.inc(kind=self.kind, name=self.name)
+
+    async def defer(self) -> None:
+        if self.deferred or self.responded_after is not None:
+            return
+        if self.kind == "component":
+            if self.ctx.issued_response:
+                return
+            with suppress(RuntimeError):  # the callback responded in the meantime
+                self.responded()
+                await self.ctx.defer(hikari.ResponseType.DEFERRED_MESSAGE_UPDATE)
+        else:
+            self.responded()
+            await self.ctx.respond(hikari.ResponseType.DEFERRED_MESSAGE_CREATE)
+        self.deferred = True
+        interaction_deferrals.inc(kind=self.kind, name=self.name)
+
+    async def run(self, work: Awaitable[T]) -> T:
+        """
+        Awaits ``work``, deferring the interaction if it outlasts the rest of the budget.
+
+        The work is not cancelled when the budget runs out, it finishes after the defer.
+        """
+        task = asyncio.ensure_future(work)
+        if not self.deferred and self.responded_after is None:
+            done, _ = await asyncio.wait({task}, timeout=self.budget - self.elapsed())
+            if not done:
+                await self.defer()
+        return await task
+
+    async def respond(self, *args, **kwargs) -> lightbulb.ResponseProxy:
+        """``ctx.respond``, after a defer the response replaces the "thinking" message."""
+        self.responded()
+        return await self.ctx.respond(*args, **kwargs)
+
+    async def send(self, builder: miru.MessageBuilder) -> None:
+        """Sends a miru builder as the initial response, or as the edit of the deferred one."""
+        if not self.deferred:
+            self.responded()
+            await builder.create_initial_response(self.ctx.interaction)
+            return
+        await self.ctx.interaction.edit_initial_response(
+            content=builder.content,
+            embeds=builder.embeds or hikari.UNDEFINED,
+            components=builder.components or hikari.UNDEFINED,
+        )
@@ -1,3 +1,7 @@
+import logging
+import os
+import tempfile
+
 import hikari
 import hikari.permissions
 import lightbulb
@@ -10,50 +14,101 @@ from extensions.rok.views import (
     Top10View,
     UnlinkmeScreen,
 )
-from extensions.database.rok import GetUser, KvK, GSheet
+from extensions.database.files import FILE_TYPES
+from extensions.database.rok import (
+    GetUser,
+    GovernorSearch,
+    GSheet,
+    KvK,
+    ScanImport,
+)
+from extensions.database.schema import TABLES
+from extensions.rok import panels
+from extensions.rok.functions import progress_embed
+from extensions.rok.responses import ResponseBudget
 
 plugin = lightbulb.Plugin("slash_commands")
 
+logger = logging.getLogger("rok.commands")
+
 get_rok_user = GetUser()
 kvk = KvK()
 gsheet_as_database_sin = GSheet("1tPcPUnAdWKzqcC6IdTjYFX5-N9wvVq_a3EIJa-kfdOo")
+scan_import = ScanImport(lock=gsheet_as_database_sin.lock)
+governor_search = GovernorSearch()
+
+
+async def governor_choices(
+    option: hikari.AutocompleteInteractionOption,
+) -> list[hikari.impl.AutocompleteChoiceBuilder]:
+    """Suggests governors by name or ID for an option that takes a governor ID."""
+    governors = await governor_search.complete(str(option.value or ""))
+    # the chosen value must have the option's type
+    as_value = int if option.type is hikari.OptionType.INTEGER else str
+    return [
+        hikari.impl.AutocompleteChoiceBuilder(
+            name=f"{governor.name} ({governor.id})"[:100], value=as_value(governor.id)
+        )
+        for governor in governors
+    ]
 
 
 @plugin.command
-@lightbulb.option("governor_id", "your governor id", int, required=True)
+@lightbulb.option(
+    "governor_id", "your governor id", int, required=True, autocomplete=True
+)
 @lightbulb.command("linkme", "Link your account")
 @lightbulb.implements(lightbulb.SlashCommand)
 async def linkme(ctx: lightbulb.SlashContext) -> None:
+    budget = ResponseBudget(ctx, "linkme")
     governor_id = ctx.options.governor_id
-    username = get_rok_user.discord_username(governor_id, "general")
+    username = await budget.run(get_rok_user.discord_username(governor_id, "general"))
 
     if username is None:
-        await ctx.respond(
+        await budget.respond(
             f"{ctx.author.mention} Sorry, I cannot find you! "
             "Please verify the ID you provided or check if you're included in the scan."
         )
         return
 
+    if panels.enabled:
+        await budget.respond(
+            **panels.linkme_start(ctx.author.id, username, governor_id)
+        )
+        return
+
     confirm_menu = CustomMenu(ctx.user)
     builder = await confirm_menu.build_response_async(
         plugin.app.d.miru,
         LinkmeScreen(confirm_menu, username, governor_id),
     )
-    await builder.create_initial_response(ctx.interaction)
+    await budget.send(builder)
     plugin.app.d.miru.start_view(confirm_menu)
 
 
+@linkme.autocomplete("governor_id")
+async def linkme_governor_id_autocomplete(
+    option: hikari.AutocompleteInteractionOption,
+    interaction: hikari.AutocompleteInteraction,
+) -> list[hikari.impl.AutocompleteChoiceBuilder]:
+    return await governor_choices(option)
+
+
 @plugin.command
 @lightbulb.command("unlinkme", "Unlinks chosen account")
 @lightbulb.implements(lightbulb.SlashCommand)
 async def unlinkme(ctx: lightbulb.SlashContext) -> None:
-    linked_ids = get_rok_user.gov_ids(ctx.author.id)
+    linked_ids = await get_rok_user.gov_ids(ctx.author.id)
     if not linked_ids:
         await ctx.respond(
             f"Sorry, I cannot find you! Seems like your account isn't linked."
         )
         return
 
+    if panels.enabled:
+        await ctx.respond(**panels.unlinkme_start(ctx.author.id))
+        return
+
     confirm_menu = CustomMenu(ctx.user)
     builder = await confirm_menu.build_response_async(
         plugin.app.d.miru,
@@ -67,7 +122,7 @@ async def unlinkme(ctx: lightbulb.SlashContext) -> None:
 @lightbulb.command("me", "Check your linked accounts")
 @lightbulb.implements(lightbulb.SlashCommand)
 async def me(ctx: lightbulb.SlashContext) -> None:
-    if user := (get_rok_user.gov_ids(ctx.user.id)):
+    if user := (await get_rok_user.gov_ids(ctx.user.id)):
         main_id, alt_id, farm_id = user.items()
     embed = hikari.Embed(color=hikari.Color.from_rgb(0, 250, 0))
 
@@ -96,7 +151,7 @@ async def me(ctx: lightbulb.SlashContext) -> None:
 
 
 @plugin.command
-@lightbulb.option("id", "Governor account ID", str, required=False)
+@lightbulb.option("id", "Governor account ID", str, required=False, autocomplete=True)
 @lightbulb.option(
     "category", "Select category", required=False, choices=["general", "kvk"]
 )
@@ -108,41 +163,103 @@ async def me(ctx: lightbulb.SlashContext) -> None:
 )
 @lightbulb.implements(lightbulb.SlashCommand)
 async def stats(ctx: lightbulb.SlashContext) -> None:
-    linked_ids = get_rok_user.gov_ids(ctx.author.id)
+    budget = ResponseBudget(ctx, "stats")
+    linked_ids = await budget.run(get_rok_user.gov_ids(ctx.author.id))
 
     if not linked_ids:
-        await ctx.respond(f"Sorry, I cannot find you! Please use linkme to link first.")
+        await budget.respond(
+            f"Sorry, I cannot find you! Please use linkme to link first."
+        )
         return
 
     settings_specified = True if ctx.options.account and ctx.options.category else False
     stats_menu = CustomMenu(ctx.author)
 
     if settings_specified:
-        builder = await stats_menu.build_response_async(
-            plugin.app.d.miru,
-            StatsPostScreen(
-                stats_menu,
-                ctx,
-                ctx.options.category,
-                ctx.options.account,
-                ctx.options.id,
-            ),
-        )
-        await builder.create_initial_response(ctx.interaction)
+        builder = await budget.run(
+            stats_menu.build_response_async(
+                plugin.app.d.miru,
+                StatsPostScreen(
+                    stats_menu,
+                    ctx,
+                    ctx.options.category,
+                    ctx.options.account,
+                    ctx.options.id,
+                ),
+            )
+        )
+        await budget.send(builder)
+    elif panels.enabled:
+        await budget.respond(**panels.stats_start(ctx.author.id))
     else:
         builder = await stats_menu.build_response_async(
             plugin.app.d.miru,
             StatsScreen(stats_menu),
         )
-        await builder.create_initial_response(ctx.interaction)
+        await budget.send(builder)
         plugin.app.d.miru.start_view(stats_menu)
 
 
+@stats.autocomplete("id")
+async def stats_id_autocomplete(
+    option: hikari.AutocompleteInteractionOption,
+    interaction: hikari.AutocompleteInteraction,
+) -> list[hikari.impl.AutocompleteChoiceBuilder]:
+    return await governor_choices(option)
+
+
+@plugin.command
+@lightbulb.option("id", "Governor account ID", int, required=False, autocomplete=True)
+@lightbulb.option(
+    "days", "How many days back to compare", int, required=False, default=7, min_value=1
+)
+@lightbulb.option(
+    "category",
+    "Select category",
+    required=False,
+    default="kvk",
+    choices=["general", "kvk"],
+)
+@lightbulb.command(
+    "progress", "Check how much a governor grew (your main account if no ID provided)"
+)
+@lightbulb.implements(lightbulb.SlashCommand)
+async def progress(ctx: lightbulb.SlashContext) -> None:
+    gov_id = ctx.options.id
+    if gov_id is None:
+        linked_ids = await get_rok_user.gov_ids(ctx.author.id)
+        gov_id = linked_ids and linked_ids["main"]
+        if not gov_id:
+            await ctx.respond(
+                "Sorry, I cannot find you! Please use linkme to link first."
+            )
+            return
+
+    embed = await progress_embed(
+        ctx.author, gov_id, ctx.options.category, ctx.options.days
+    )
+    if embed is None:
+        await ctx.respond(
+            "Not enough scans yet to show progress for this account.",
+            flags=hikari.MessageFlag.EPHEMERAL,
+        )
+        return
+    await ctx.respond(embed=embed)
+
+
+@progress.autocomplete("id")
+async def progress_id_autocomplete(
+    option: hikari.AutocompleteInteractionOption,
+    interaction: hikari.AutocompleteInteraction,
+) -> list[hikari.impl.AutocompleteChoiceBuilder]:
+    return await governor_choices(option)
+
+
 @plugin.command()
 @lightbulb.command("total", "Fetch and display cumulative KvK stats of top 300 players")
 @lightbulb.implements(lightbulb.SlashCommand)
 async def total(ctx: lightbulb.SlashContext) -> None:
-    global_stats = kvk.kvk_top_300_global_stats()
+    global_stats = await kvk.kvk_top_300_global_stats()
     if global_stats:
         embed = hikari.Embed(
             title="KvK stats of Top 300 by power",
@@ -167,16 +284,48 @@ async def total(ctx: lightbulb.SlashContext) -> None:
     required=True,
     choices=["T4 Kills", "T5 Kills", "Deaths"],
 )
+@lightbulb.option(
+    "count",
+    "How many players to show",
+    int,
+    required=False,
+    default=10,
+    min_value=1,
+    max_value=25,
+)
 @lightbulb.command("top10", "Fetch and display top 10 players in selected category")
 @lightbulb.implements(lightbulb.SlashCommand)
 async def top10(ctx: lightbulb.SlashContext) -> None:
-    view = Top10View(category=ctx.options.category)
-    response = await ctx.respond(components=view, embed=view.embed(ctx))
+    if panels.enabled:
+        page = await panels.top10_page(
+            ctx.options.category, ctx.options.count, "nicknames"
+        )
+        await ctx.respond(**page)
+        return
+
+    view = Top10View(
+        category=ctx.options.category, limit=ctx.options.count, author=ctx.author
+    )
+    response = await ctx.respond(components=view, embed=await view.embed(ctx))
     message = await response
     plugin.app.d.miru.start_view(view, bind_to=message)
 
 
 @plugin.command
+@lightbulb.option(
+    "force",
+    "Sync even if a table would lose more than half of its rows",
+    type=bool,
+    required=False,
+    default=False,
+)
+@lightbulb.option(
+    "mode",
+    "delta only writes changed rows, full rebuilds the tables",
+    required=False,
+    default="delta",
+    choices=["delta", "full"],
+)
 @lightbulb.command("sync_to_sheet", "Synchronises bot's db with the google sheet")
 @lightbulb.implements(lightbulb.SlashCommand)
 @administration_only
@@ -186,14 +335,94 @@ async def sync_to_sheet(ctx: lightbulb.SlashContext) -> None:
             "Syncing database with Google Sheets...", flags=hikari.MessageFlag.EPHEMERAL
         )
         message = await response
-        gsheet_as_database_sin.sync_db_with_sheets()
-        await message.edit("Database successfully synced with Google Sheets.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        report = await gsheet_as_database_sin.sync_db_with_sheets(
+            ctx.options.mode, ctx.options.force
+        )
+        await message.edit(
+            f"Database successfully synced with Google Sheets.\n{report.summary()}"
+        )
+    except ValueError as e:
+        # the data failed a check, nothing was changed
+        await message.edit(f"The database was left as is: {e}")
+    except Exception:
+        logger.exception("Syncing with Google Sheets failed")
         await message.edit(
             "An error occurred while syncing the database. Please check the logs for details."
         )
 
 
+@plugin.command
+@lightbulb.option(
+    "force",
+    "Import even if the table would lose more than half of its rows",
+    type=bool,
+    required=False,
+    default=False,
+)
+@lightbulb.option(
+    "mode",
+    "delta only writes changed rows, full rebuilds the table",
+    required=False,
+    default="delta",
+    choices=["delta", "full"],
+)
+@lightbulb.option(
+    "table",
+    "Table to load into, detected from the headers by default",
+    required=False,
+    default=None,
+    choices=list(TABLES),
+)
+@lightbulb.option(
+    "file", "CSV or XLSX scan export", type=hikari.Attachment, required=True
+)
+@lightbulb.command("import_scan", "Loads a CSV or XLSX scan export into bot's db")
+@lightbulb.implements(lightbulb.SlashCommand)
+@administration_only
+async def import_scan(ctx: lightbulb.SlashContext) -> None:
+    attachment: hikari.Attachment = ctx.options.file
+    extension = os.path.splitext(attachment.filename)[1].lower()
+    if extension not in FILE_TYPES:
+        await ctx.respond(
+            f"Only {', '.join(FILE_TYPES)} files can be imported.",
+            flags=hikari.MessageFlag.EPHEMERAL,
+        )
+        return
+
+    response = await ctx.respond(
+        f"Importing {attachment.filename}...", flags=hikari.MessageFlag.EPHEMERAL
+    )
+    message = await response
+    # the file is streamed to disk, never held in memory as a whole
+    handle, path = tempfile.mkstemp(suffix=extension)
+    try:
+        with os.fdopen(handle, "wb") as file:
+            async with attachment.stream() as stream:
+                async for chunk in stream:
+                    file.write(chunk)
+        report = await scan_import.import_file(
+            path, ctx.options.table, ctx.options.mode, ctx.options.force
+        )
+        await message.edit(
+            f"{attachment.filename} successfully imported.\n{report.summary()}"
+        )
+    except Exception as e:
+        logger.exception("Importing %s failed", attachment.filename)
+        await message.edit(f"Couldn't import {attachment.filename}: {e}")
+    finally:
+        os.remove(path)
+
+
+@plugin.listener(lightbulb.LightbulbStartedEvent)
+async def on_started(event: lightbulb.LightbulbStartedEvent) -> None:
+    # build the autocomplete index before the first keystroke needs it
+    await governor_search.refresh_index()
+
+
+@plugin.listener(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent) -> None:
+    await gsheet_as_database_sin.close()
+
+
 def load(bot) -> None:
     bot.add_plugin(plugin)
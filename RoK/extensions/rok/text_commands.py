@@ -1,36 +1,71 @@
+import logging
+from typing import Awaitable, Callable
+
 import hikari
 import lightbulb
+from data_manager import config
+from metrics import command_errors, command_seconds
+from extensions.rok import panels
 from extensions.rok.views import CustomMenu, StatsScreen
 from extensions.database.rok import GetUser
 
 plugin = lightbulb.Plugin("text_commands")
 get_rok_user = GetUser()
 
+logger = logging.getLogger("rok.commands")
+
+prefix: str = config()["bot"]["prefix"]
+
+TextCommand = Callable[[hikari.MessageCreateEvent, str], Awaitable[None]]
+# command name: callback(event, arguments)
+commands: dict[str, TextCommand] = {}
+
+
+def text_command(name: str) -> Callable[[TextCommand], TextCommand]:
+    """Registers a text command, invoked as ``<prefix><name> [arguments]``."""
+
+    def decorator(func: TextCommand) -> TextCommand:
+        commands[name.lower()] = func
+        return func
+
+    return decorator
+
 
 @plugin.listener(hikari.MessageCreateEvent)
 async def on_message_create(event: hikari.MessageCreateEvent) -> None:
-    if not event.is_human or not event.content:
+    # runs for every message the bot sees, so anything that isn't a command is
+    # turned away by this one check
+    content = event.content
+    if content is None or not content.startswith(prefix) or not event.is_human:
         return
 
-    content = event.content.split()
-    command = content[0].lower()
-    prefix = "!"
-
-    print("content: ", content)
-    print("command: ", command)
+    name, _, arguments = content[len(prefix) :].partition(" ")
+    if (command := commands.get(name.lower())) is None:
+        return
 
-    if command == prefix + "mystats":
-        await mystats(event)
+    name = name.lower()
+    logger.debug("%s used %s%s", event.author.id, prefix, name)
+    try:
+        with command_seconds.time(kind="text", name=name):
+            await command(event, arguments.strip())
+    except Exception:
+        command_errors.inc(kind="text", name=name)
+        logger.exception("Text command %s failed", name)
 
 
-async def mystats(ctx: hikari.MessageCreateEvent):
-    linked_ids = get_rok_user.gov_ids(ctx.author.id)
+@text_command("mystats")
+async def mystats(ctx: hikari.MessageCreateEvent, arguments: str) -> None:
+    linked_ids = await get_rok_user.gov_ids(ctx.author.id)
     if not linked_ids:
         await ctx.message.respond(
             "Sorry, I cannot find you! Please use linkme to link first."
         )
         return
 
+    if panels.enabled:
+        await ctx.message.respond(**panels.stats_start(ctx.author.id))
+        return
+
     stats_menu = CustomMenu(ctx.author)
     builder = await stats_menu.build_response_async(
         plugin.app.d.miru,
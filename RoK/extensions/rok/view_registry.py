@@ -0,0 +1,291 @@
+import asyncio
+import functools
+import logging
+import sys
+import time
+import types
+from typing import NamedTuple, Optional
+
+import hikari
+import lightbulb
+import miru
+from data_manager import config
+from metrics import Counter, Gauge, registry
+from extensions.rok import panels
+
+logger = logging.getLogger("rok.views")
+
+###
+### Bounded view registry
+###
+# Every open menu or view is a live object until it times out. BoundedClient keeps
+# count of them per user and overall, and evicts the oldest one when a cap is hit, so
+# spamming commands can't grow memory without bound. Buttons of expired and evicted
+# views are disabled through one paced queue instead of one message edit each, so a
+# burst of expirations doesn't become a burst of REST calls.
+#
+# Only public miru API is used: a view is forgotten once View.wait() returns, which it
+# does however the view stopped.
+
+DEFAULT_SETTINGS = {
+    "max_views_per_user": 5,
+    "max_views": 1000,
+    "timeout_edits_per_second": 5.0,
+}
+
+# shared by every view, not counted in a view's size
+SHARED_TYPES = (
+    miru.Client,
+    lightbulb.BotApp,
+    hikari.api.RESTClient,
+    hikari.api.Cache,
+    hikari.api.EntityFactory,
+    asyncio.AbstractEventLoop,
+    asyncio.Future,
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.MethodType,
+)
+MAX_DEPTH = 8
+
+views_evicted = registry.register(
+    Counter(
+        "rok_views_evicted_total",
+        "Views stopped early because a view cap was hit.",
+        ("cap",),
+    )
+)
+view_edits = registry.register(
+    Counter(
+        "rok_view_disable_edits_total",
+        "Messages edited to disable the buttons of stopped views, by outcome.",
+        ("outcome",),
+    )
+)
+
+
+def settings() -> dict:
+    return {**DEFAULT_SETTINGS, **config().get("interactions", {})}
+
+
+def approximate_size(obj, seen: Optional[set] = None, depth: int = 0) -> int:
+    """
+    Approximate bytes held by ``obj`` and what it references, once per object.
+
+    Objects shared between views, like the bot and the miru client, aren't followed.
+    """
+    seen = set() if seen is None else seen
+    if depth > MAX_DEPTH or id(obj) in seen or isinstance(obj, SHARED_TYPES):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approximate_size(key, seen, depth + 1)
+            size += approximate_size(value, seen, depth + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            size += approximate_size(value, seen, depth + 1)
+    elif not isinstance(obj, (str, bytes, int, float)):
+        if hasattr(obj, "__dict__"):
+            size += approximate_size(vars(obj), seen, depth + 1)
+        for slot in getattr(type(obj), "__slots__", ()):
+            size += approximate_size(getattr(obj, slot, None), seen, depth + 1)
+    return size
+
+
+class DisableQueue:
+    """
+    Disables the buttons of stopped views, at most ``rate`` message edits per second.
+
+    A message queued again before its edit was sent is edited once, with its latest
+    components. An edit that hits a rate limit too long for hikari to wait out is
+    queued again.
+    """
+
+    def __init__(self, rate: float = 5.0):
+        self.rate = rate
+        # message id: (message, components), in queueing order
+        self._pending: dict[int, tuple[hikari.Message, list]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, view: miru.View) -> None:
+        if view.message is None:
+            return
+        for item in view.children:
+            item.disabled = True
+        if view.message.id in self._pending:
+            view_edits.inc(outcome="coalesced")
+        self._pending[view.message.id] = (view.message, view.build())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        while self._pending:
+            message_id = next(iter(self._pending))
+            message, components = self._pending.pop(message_id)
+            try:
+                await message.edit(components=components)
+                view_edits.inc(outcome="edited")
+            except (hikari.NotFoundError, hikari.ForbiddenError):
+                view_edits.inc(outcome="gone")  # deleted, or an ephemeral message
+            except hikari.RateLimitTooLongError as error:
+                view_edits.inc(outcome="rate_limited")
+                self._pending.setdefault(message_id, (message, components))
+                await asyncio.sleep(error.retry_after)
+            except Exception:
+                view_edits.inc(outcome="failed")
+                logger.exception("Failed to disable the buttons of %s", message_id)
+            await asyncio.sleep(1 / self.rate)
+
+
+class ViewRecord(NamedTuple):
+    owner_id: Optional[int]
+    started_at: float
+    size: int
+
+
+class BoundedClient(miru.Client):
+    """
+    A miru client that caps the views running at once, per user and overall.
+
+    The owner of a view is its ``author``; views without one only count towards the
+    overall cap. When a cap is hit the oldest view is disabled and stopped.
+
+    Memory is approximated once per view class, from the first view of it started,
+    walking every view's objects would slow down each command.
+    """
+
+    def __init__(
+        self,
+        app,
+        *,
+        max_views_per_user: int = 5,
+        max_views: int = 1000,
+        timeout_edits_per_second: float = 5.0,
+        **kwargs,
+    ):
+        super().__init__(app, **kwargs)
+        self.max_views_per_user = max_views_per_user
+        self.max_views = max_views
+        self.disable_queue = DisableQueue(timeout_edits_per_second)
+        # in start order, oldest first
+        self.views: dict[miru.View, ViewRecord] = {}
+        self.views_by_owner: dict[int, dict[miru.View, None]] = {}
+        self.memory = 0
+        # view class: approximate size of one view
+        self.view_sizes: dict[type, int] = {}
+        # tasks waiting for a view to stop
+        self._watchers: set[asyncio.Task] = set()
+
+    def start_view(self, view: miru.View, *, bind_to=hikari.UNDEFINED) -> None:
+        super().start_view(view, bind_to=bind_to)
+        if not view.children:
+            return  # miru ignored it
+
+        author = getattr(view, "author", None)
+        owner_id = None if author is None else int(author.id)
+        owned = self.views_by_owner.get(owner_id, {})
+        while owned and len(owned) >= self.max_views_per_user:
+            self.evict(next(iter(owned)), cap="user")
+        while len(self.views) >= self.max_views:
+            self.evict(next(iter(self.views)), cap="global")
+
+        if owner_id is not None:
+            self.views_by_owner.setdefault(owner_id, {})[view] = None
+
+        if (size := self.view_sizes.get(type(view))) is None:
+            size = self.view_sizes[type(view)] = approximate_size(view)
+        record = ViewRecord(owner_id, time.monotonic(), size)
+        self.views[view] = record
+        self.memory += record.size
+
+        watcher = asyncio.create_task(view.wait())
+        self._watchers.add(watcher)
+        watcher.add_done_callback(functools.partial(self._stopped, view))
+
+    def evict(self, view: miru.View, cap: str) -> None:
+        views_evicted.inc(cap=cap)
+        self.disable_queue.put(view)
+        view.stop()
+        self._forget(view)
+
+    def _stopped(self, view: miru.View, watcher: asyncio.Task) -> None:
+        self._watchers.discard(watcher)
+        self._forget(view)
+
+    def _forget(self, view) -> None:
+        if (record := self.views.pop(view, None)) is None:
+            return
+        self.memory -= record.size
+        if record.owner_id is not None:
+            owned = self.views_by_owner[record.owner_id]
+            owned.pop(view, None)
+            if not owned:
+                del self.views_by_owner[record.owner_id]
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Counts and approximate memory of the running views.
+
+            :format: {"views": int, "owners": int, "memory_bytes": int, "queued_edits": int}
+        """
+        return {
+            "views": len(self.views),
+            "owners": len(self.views_by_owner),
+            "memory_bytes": self.memory,
+            "queued_edits": len(self.disable_queue),
+        }
+
+
+# the client of the running bot, see create_client
+client: Optional[BoundedClient] = None
+
+
+async def on_unhandled_component(interaction: hikari.ComponentInteraction) -> None:
+    # stateless panel buttons have no view, the panels plugin answers them
+    if panels.parse(interaction.custom_id) is not None:
+        return
+    logger.warning(
+        "Component %s pressed, but no running view has it", interaction.custom_id
+    )
+
+
+def create_client(app) -> BoundedClient:
+    """Creates the bot's miru client, with the caps from config.json."""
+    global client
+    limits = settings()
+    client = BoundedClient(app, **{key: limits[key] for key in DEFAULT_SETTINGS})
+    client.set_unhandled_component_interaction_hook(on_unhandled_component)
+    return client
+
+
+def _client_stat(stat: str):
+    return lambda: {(): client.stats()[stat] if client else None}
+
+
+registry.register(
+    Gauge(
+        "rok_views_running", "Views and menus running.", collect=_client_stat("views")
+    )
+)
+registry.register(
+    Gauge(
+        "rok_views_memory_bytes",
+        "Approximate memory held by running views, estimated once per view class.",
+        collect=_client_stat("memory_bytes"),
+    )
+)
+registry.register(
+    Gauge(
+        "rok_views_queued_edits",
+        "Stopped views waiting for their buttons to be disabled.",
+        collect=_client_stat("queued_edits"),
+    )
+)
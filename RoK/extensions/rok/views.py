@@ -4,8 +4,11 @@ import hikari
 import lightbulb
 import miru
 import miru.ext.menu
-from extensions.rok.functions import stats_embed
+from extensions.rok.functions import leaderboard_embeds, stats_embed, user_resolver
+from extensions.rok.responses import ResponseBudget
+from extensions.rok.view_registry import BoundedClient
 from extensions.database.rok import GetUser, Id, KvK
+from metrics import command_errors, command_seconds
 from miru.ext import menu
 
 user_id = Id()
@@ -13,7 +16,55 @@ get_rok_user = GetUser()
 kvk = KvK()
 
 
-class CustomMenu(menu.Menu):
+class TimedView(miru.View):
+    """
+    Times every component callback of the view in ``rok_command_seconds`` and runs it
+    under a ResponseBudget, which replaces miru's fixed 2 second autodefer.
+
+    miru has no hook around a callback, so the callback of every item is wrapped as
+    the item is added, through the public ``add_item``.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        kwargs.setdefault("autodefer", False)
+        super().__init__(*args, **kwargs)
+
+    def add_item(self, item):
+        # menus add the same items again each time their screen is shown
+        if not getattr(item.callback, "timed", False):
+            item.callback = self._timed(item, item.callback)
+        return super().add_item(item)
+
+    def _timed(self, item, callback):
+        async def timed(context: miru.ViewContext) -> None:
+            # menus show their current screen, name the callback after it
+            owner = getattr(self, "current_screen", None) or self
+            label = getattr(item, "label", None) or item.custom_id
+            name = f"{type(owner).__name__}.{label}"
+            budget = ResponseBudget(context, name)
+            with command_seconds.time(kind="component", name=name):
+                await budget.run(callback(context))
+            if context.issued_response:
+                budget.responded()
+
+        timed.timed = True
+        return timed
+
+    async def on_error(self, error: Exception, item=None, context=None) -> None:
+        command_errors.inc(kind="component", name=type(self).__name__)
+        await super().on_error(error, item, context)
+
+    async def on_timeout(self) -> None:
+        if isinstance(self.client, BoundedClient):
+            # paced together with every other expiring view
+            self.client.disable_queue.put(self)
+        elif self.message:
+            for button in self.children:
+                button.disabled = True
+            await self.message.edit(components=self)
+
+
+class CustomMenu(TimedView, menu.Menu):
     def __init__(self, author, timeout: float = 120):
         super().__init__(timeout=timeout)
         self.author = author
@@ -27,12 +78,6 @@ class CustomMenu(menu.Menu):
             return False
         return True
 
-    async def on_timeout(self) -> None:
-        if self.message:
-            for button in self.children:
-                button.disabled = True
-            await self.message.edit(components=self)
-
 
 class LinkmeScreen(menu.Screen):
     def __init__(
@@ -82,7 +127,7 @@ class LinkmeAccontSelectionScreen(menu.Screen):
 
     @menu.button(label="Main Account")
     async def main_acc_button(self, ctx: miru.ViewContext, button: miru.Button) -> None:
-        user_id.save(ctx.user.id, ctx.user.username, self.gid, "main")
+        await user_id.save(ctx.user.id, ctx.user.username, self.gid, "main")
         await ctx.edit_response(
             content="You have been successfully registered.", components=[]
         )
@@ -92,7 +137,7 @@ class LinkmeAccontSelectionScreen(menu.Screen):
     async def second_acc_button(
         self, ctx: miru.ViewContext, button: miru.Button
     ) -> None:
-        user_id.save(ctx.user.id, ctx.user.username, self.gid, "alt")
+        await user_id.save(ctx.user.id, ctx.user.username, self.gid, "alt")
         await ctx.edit_response(
             content="You have been successfully registered.", components=[]
         )
@@ -100,7 +145,7 @@ class LinkmeAccontSelectionScreen(menu.Screen):
 
     @menu.button(label="Farm Account", style=hikari.ButtonStyle.SECONDARY)
     async def farm_acc_button(self, ctx: miru.ViewContext, button: miru.Button) -> None:
-        user_id.save(ctx.user.id, ctx.user.username, self.gid, "farm")
+        await user_id.save(ctx.user.id, ctx.user.username, self.gid, "farm")
         await ctx.edit_response(
             content="You have been successfully registered.", components=[]
         )
@@ -116,7 +161,7 @@ class UnlinkmeScreen(menu.Screen):
         self, ctx: miru.ViewContext, button: menu.ScreenButton
     ) -> None:
         acc_type = "main"
-        if self.account_exists(ctx, acc_type):
+        if await self.account_exists(ctx, acc_type):
             await self.menu.push(UnlinkmeConfirmationScreen(self.menu, ctx, acc_type))
         else:
             await ctx.edit_response("Account not found", components=None)
@@ -126,7 +171,7 @@ class UnlinkmeScreen(menu.Screen):
         self, ctx: miru.ViewContext, button: menu.ScreenButton
     ) -> None:
         acc_type = "alt"
-        if self.account_exists(ctx, acc_type):
+        if await self.account_exists(ctx, acc_type):
             await self.menu.push(UnlinkmeConfirmationScreen(self.menu, ctx, acc_type))
         else:
             await ctx.edit_response("Account not found", components=None)
@@ -136,14 +181,14 @@ class UnlinkmeScreen(menu.Screen):
         self, ctx: miru.ViewContext, button: menu.ScreenButton
     ) -> None:
         acc_type = "farm"
-        if self.account_exists(ctx, acc_type):
+        if await self.account_exists(ctx, acc_type):
             await self.menu.push(UnlinkmeConfirmationScreen(self.menu, ctx, acc_type))
         else:
             await ctx.edit_response("Account not found", components=None)
 
-    def account_exists(self, ctx: miru.ViewContext, acc_type: str) -> bool:
+    async def account_exists(self, ctx: miru.ViewContext, acc_type: str) -> bool:
         user = ctx.user
-        acc_id = get_rok_user.gov_ids(user.id)[acc_type]
+        acc_id = (await get_rok_user.gov_ids(user.id))[acc_type]
         if not acc_id:
             return False
         return True
@@ -162,7 +207,7 @@ class UnlinkmeConfirmationScreen(menu.Screen):
 
     async def build_content(self) -> menu.ScreenContent:
         user = self.ctx.user
-        if acc := get_rok_user.gov_ids(user.id):
+        if acc := await get_rok_user.gov_ids(user.id):
             acc_id = acc[self.acc_type]
         embed = hikari.Embed(
             title="Are you sure you want to unlink this account?",
@@ -175,7 +220,7 @@ class UnlinkmeConfirmationScreen(menu.Screen):
     async def yes_button(
         self, ctx: miru.ViewContext, button: menu.ScreenButton
     ) -> None:
-        user_id.remove(ctx.user.id, self.acc_type)
+        await user_id.remove(ctx.user.id, self.acc_type)
         await ctx.edit_response(
             f"{self.acc_type.capitalize()} account unlinked",
             components=None,
@@ -260,7 +305,7 @@ class StatsPostScreen(menu.Screen):
         if self.user_id == None:
             # get it from database
             if gov_user := (
-                get_rok_user.gov_user(
+                await get_rok_user.gov_user(
                     self.ctx.user.id, self.acc_category, self.acc_type
                 )
             ):
@@ -270,55 +315,53 @@ class StatsPostScreen(menu.Screen):
                 return menu.ScreenContent(f"No {self.acc_type} account registered")
 
         else:
-            gov_user_id = get_rok_user.gov_ids(user.id)[self.acc_type]
+            gov_user_id = (await get_rok_user.gov_ids(user.id))[self.acc_type]
 
         embed = await stats_embed(user, gov_user_id, self.acc_category)
         return menu.ScreenContent(embed=embed)
 
     async def get_user(self) -> hikari.User:
         if self.user_id:
-            if user_disc_id := (get_rok_user.discord_id_from_gov_id(self.user_id)):
-                user = await self.ctx.bot.rest.fetch_user(user_disc_id)
+            if user_disc_id := (
+                await get_rok_user.discord_id_from_gov_id(self.user_id)
+            ):
+                # miru contexts carry the client, lightbulb ones the bot
+                app = (
+                    self.ctx.client
+                    if isinstance(self.ctx, miru.ViewContext)
+                    else self.ctx.app
+                )
+                user = await user_resolver.fetch(app, user_disc_id)
             return user
         return self.ctx.user
 
 
-class Top10View(miru.View):
-    def __init__(self, category) -> None:
+class Top10View(TimedView):
+    """
+    Leaderboard of the top players in a category, with a button that switches between
+    nicknames and governor IDs.
+
+    Both renderings are built once, pressing the button only swaps them.
+    """
+
+    def __init__(
+        self, category, limit: int = 10, author: Optional[hikari.User] = None
+    ) -> None:
         super().__init__()
+        self.author = author  # who opened it, counts towards their view cap
         self.category = category
+        self.limit = limit
         self.toggle_state = "nicknames"
+        self.embeds: dict[str, hikari.Embed] = {}
 
     @miru.button(label="Toggle names")
     async def toggleNames_button(
         self, ctx: miru.ViewContext, button: miru.Button
     ) -> None:
-        await ctx.edit_response(embed=self.embed(ctx))
-
-    def embed(self, ctx: miru.ViewContext):
-        top_players = kvk.kvk_top_x_player_stats(self.category)
-        embed = hikari.Embed(
-            title=f"Top 10 players by {self.category}",
-            color=hikari.Color.from_rgb(0, 250, 0),
-        )
+        self.toggle_state = "ids" if self.toggle_state == "nicknames" else "nicknames"
+        await ctx.edit_response(embed=await self.embed(ctx))
 
-        if self.toggle_state == "nicknames":
-            for x, (player, details) in enumerate(top_players.items(), 1):
-                embed.add_field(
-                    f"{x}: {player}", f"<:4_:1277422678470430750> {details['score']}"
-                )
-            self.toggle_state = "ids"
-        elif self.toggle_state == "ids":
-            for x, (_, details) in enumerate(top_players.items(), 1):
-                embed.add_field(
-                    f"{x}: {details['player_id']}",
-                    f"<:4_:1277422678470430750> {details['score']}",
-                )
-            self.toggle_state = "nicknames"
-        return embed
-
-    async def on_timeout(self) -> None:
-        if self.message:
-            for button in self.children:
-                button.disabled = True
-            await self.message.edit(components=self)
+    async def embed(self, ctx: Optional[miru.ViewContext] = None) -> hikari.Embed:
+        if not self.embeds:
+            self.embeds = await leaderboard_embeds(self.category, self.limit)
+        return self.embeds[self.toggle_state]
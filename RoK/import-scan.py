@@ -0,0 +1,41 @@
+"""
+Loads a CSV or XLSX scan export into the bot's database without Google Sheets.
+
+usage: python import-scan.py scan.xlsx [--table kvk_top_600] [--mode full]
+"""
+
+import argparse
+import asyncio
+import time
+
+from extensions.database.ingest import LOADERS
+from extensions.database.rok import ScanImport, default_pool
+from extensions.database.schema import TABLES, migrate
+
+
+async def main(args: argparse.Namespace) -> None:
+    default_pool.execute(migrate)
+    began = time.perf_counter()
+    try:
+        report = await ScanImport().import_file(args.path, args.table, args.mode)
+    finally:
+        default_pool.close()
+    print(report.summary())
+    print(f"Imported in {time.perf_counter() - began:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="CSV or XLSX file, header row first")
+    parser.add_argument(
+        "--table",
+        choices=list(TABLES),
+        help="table to load into, detected from the headers by default",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=list(LOADERS),
+        default="delta",
+        help="delta only writes changed rows, full rebuilds the table",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,264 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+###
+### Metrics
+###
+# A minimal in-process registry rendered in the Prometheus text format. Metrics can be
+# updated from the event loop and from the database worker threads alike.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+SYNC_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Yields the metric's sample lines."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Gauge(Metric):
+    """A value read when the metrics are rendered, from ``collect()``."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple = (),
+        collect: Optional[Callable[[], dict[tuple, Optional[float]]]] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.collect = collect or (lambda: {})
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.collect().items():
+            if value is not None:
+                yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class CollectedCounter(Gauge):
+    """A counter kept by some other object, read from ``collect()`` like a Gauge."""
+
+    type = "counter"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key: [count per bucket..., count in +Inf, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observes how long the ``with`` block took, in seconds."""
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - began, **labels)
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(counts[-1])}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+command_seconds = registry.register(
+    Histogram(
+        "rok_command_seconds",
+        "Time spent handling commands and component interactions.",
+        ("kind", "name"),
+    )
+)
+command_errors = registry.register(
+    Counter("rok_command_errors_total", "Commands that failed.", ("kind", "name"))
+)
+response_seconds = registry.register(
+    Histogram(
+        "rok_interaction_response_seconds",
+        "Time until an interaction got its first response, deferrals included.",
+        ("kind", "name"),
+    )
+)
+interaction_deferrals = registry.register(
+    Counter(
+        "rok_interaction_deferrals_total",
+        "Interactions deferred because their response ran over the budget.",
+        ("kind", "name"),
+    )
+)
+deadline_misses = registry.register(
+    Counter(
+        "rok_interaction_deadline_misses_total",
+        "Interactions first responded to after Discord's 3 second deadline.",
+        ("kind", "name"),
+    )
+)
+db_query_seconds = registry.register(
+    Histogram(
+        "rok_db_query_seconds",
+        "Time spent running database methods on a worker thread.",
+        ("query",),
+        QUERY_BUCKETS,
+    )
+)
+external_seconds = registry.register(
+    Histogram(
+        "rok_external_request_seconds",
+        "Time spent waiting on Discord REST and Google APIs.",
+        ("call",),
+    )
+)
+coalesced_calls = registry.register(
+    Counter(
+        "rok_coalesced_calls_total",
+        "Database reads that joined an identical read in flight instead of running.",
+        ("call",),
+    )
+)
+sync_seconds = registry.register(
+    Histogram(
+        "rok_sync_seconds",
+        "Duration of syncs and file imports, download included.",
+        ("source", "mode"),
+        SYNC_BUCKETS,
+    )
+)
+
+# name: cache object with a stats() method, see register_cache
+caches: dict[str, object] = {}
+
+
+def register_cache(name: str, cache) -> None:
+    """Exposes a cache's hit, miss and size counters under ``name``."""
+    caches[name] = cache
+
+
+def _cache_stat(stat: str) -> Callable[[], dict]:
+    return lambda: {(name,): cache.stats()[stat] for name, cache in caches.items()}
+
+
+registry.register(
+    CollectedCounter(
+        "rok_cache_hits_total", "Cache hits.", ("cache",), _cache_stat("hits")
+    )
+)
+registry.register(
+    CollectedCounter(
+        "rok_cache_misses_total", "Cache misses.", ("cache",), _cache_stat("misses")
+    )
+)
+registry.register(
+    Gauge("rok_cache_hit_ratio", "Cache hit rate.", ("cache",), _cache_stat("hit_rate"))
+)
+registry.register(
+    Gauge("rok_cache_entries", "Entries in a cache.", ("cache",), _cache_stat("size"))
+)
@@ -1,18 +1,67 @@
+import time
+
+# taken before anything else is imported so the startup report covers imports too
+started_at = time.perf_counter()
+
+import logging
 import os
 
 import hikari
 import lightbulb
-import miru
 from data_manager import bot_dir, config
+from extensions.database.rok import default_pool
+from extensions.database.schema import migrate
+from extensions.rok import view_registry
 
 os.chdir(bot_dir)  # set bot's work directory
 
+# phase: milliseconds, logged right before connecting
+startup_timings = {}
+
+
+def end_phase(phase: str, began: float) -> float:
+    """Records how long a startup phase took and returns when it ended."""
+    ended = time.perf_counter()
+    startup_timings[phase] = (ended - began) * 1000
+    return ended
+
+
+phase_began = end_phase("imports", started_at)
+
 bot_config = config()["bot"]
 
+# Only what the extensions use: slash commands and menus need no cache, is_admin reads
+# member roles from the cache, text commands and the mention reply read messages.
+DEFAULT_GATEWAY = {
+    "intents": ["GUILDS", "GUILD_MESSAGES", "DM_MESSAGES", "MESSAGE_CONTENT"],
+    "cache_components": ["GUILDS", "ROLES", "ME"],
+    "max_messages": 0,
+}
+
+
+def flags_from_names(flag_type: type, names: list[str]):
+    """Combines flag names from config.json, like ["GUILDS", "ROLES"], into one flag."""
+    flags = flag_type.NONE
+    for name in names:
+        flags |= flag_type[name.upper()]
+    return flags
+
+
+gateway_config = {**DEFAULT_GATEWAY, **config().get("gateway", {})}
+intents = flags_from_names(hikari.Intents, gateway_config["intents"])
+cache_settings = hikari.impl.CacheSettings(
+    components=flags_from_names(
+        hikari.api.CacheComponents, gateway_config["cache_components"]
+    ),
+    max_messages=gateway_config["max_messages"],
+)
+
 bot = lightbulb.BotApp(
     token=bot_config["token"],
-    prefix=bot_config["prefix"],
-    intents=hikari.Intents.ALL,
+    # no prefix: text commands are dispatched by extensions.rok.text_commands, given
+    # the prefix lightbulb would parse them again and raise CommandNotFound
+    intents=intents,
+    cache_settings=cache_settings,
     owner_ids=bot_config["owner_id"],
     # default_enabled_guilds=[bot_config["guild_id"]],
     logs={
@@ -23,28 +72,51 @@ bot = lightbulb.BotApp(
             # "hikari.ratelimits": {"level": "TRACE_HIKARI"},
             "lightbulb": {"level": "INFO"},
             "miru": {"level": "INFO"},
+            "rok": {"level": "INFO"},
         },
     },
 )
+phase_began = end_phase("bot init", phase_began)
 
 
 # to ensure the bot's ability to write
 @bot.listen(hikari.MessageCreateEvent)
 async def on_message_create(event: hikari.MessageCreateEvent) -> None:
-    if event.content and bot.get_me().mention in event.content:
+    # mentions come parsed with the message, a dict lookup instead of a content search
+    if (me := bot.get_me()) and me.id in (event.message.user_mentions or {}):
         await event.message.respond("You mentioned me!")
 
 
-bot.d.miru = miru.Client(bot)
+bot.d.miru = view_registry.create_client(bot)
+bot.d.started_at = started_at
 
 if __name__ == "__main__":
+    # bring rok.sqlite3 up to the current schema before anything queries it
+    phase_began = time.perf_counter()
+    default_pool.execute(migrate)
+    phase_began = end_phase("migrations", phase_began)
+
     # main modules
     bot.load_extensions("extensions.rok.slash_commands")
     bot.load_extensions("extensions.rok.text_commands")
+    bot.load_extensions("extensions.rok.panels")
+    bot.load_extensions("extensions.rok.auto_sync")
     bot.load_extensions("extensions.listeners")
+    bot.load_extensions("extensions.metrics_server")
 
     # external modules
     if os.path.exists(bot_dir + "/extensions/test.py"):
         bot.load_extensions("extensions.test")
+    end_phase("extensions", phase_began)
 
+    logging.getLogger("rok.startup").info(
+        "Gateway intents: %s; cache components: %s",
+        intents,
+        cache_settings.components,
+    )
+    logging.getLogger("rok.startup").info(
+        "Startup took %.0f ms before connecting (%s)",
+        (time.perf_counter() - started_at) * 1000,
+        ", ".join(f"{phase}: {ms:.0f} ms" for phase, ms in startup_timings.items()),
+    )
     bot.run()